@@ -1,7 +1,8 @@
+import re
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from collections import Counter
+from utils.csv_io import read_csv_fast
 
 st.set_page_config(
     page_title="Product Tag Analyzer",
@@ -11,28 +12,19 @@ st.set_page_config(
 
 st.title("Product Tag Analyzer")
 
+def split_tags(tags):
+    """Split a Tags column into one stripped tag per row."""
+    return tags.dropna().astype(str).str.split(',').explode().str.strip()
+
 def get_unique_tags(df):
     """Extract all unique tags from the Tags column."""
-    all_tags = []
-    for tags in df['Tags'].dropna():
-        tags_list = [tag.strip() for tag in tags.split(',')]
-        all_tags.extend(tags_list)
-    return sorted(set(all_tags))
+    return sorted(split_tags(df['Tags']).unique())
 
+@st.cache_data(show_spinner=False)
 def count_products_per_tag(df):
     """Count how many unique products belong to each tag."""
-    tag_counts = Counter()
-    
-    for idx, row in df.drop_duplicates(subset='Handle').iterrows():
-        if pd.notna(row['Tags']):
-            tags = [tag.strip() for tag in row['Tags'].split(',')]
-            for tag in tags:
-                tag_counts[tag] += 1
-                
-    return pd.DataFrame(
-        {'Tag': list(tag_counts.keys()), 
-         'Product Count': list(tag_counts.values())}
-    ).sort_values('Product Count', ascending=False)
+    tags = split_tags(df.drop_duplicates(subset='Handle')['Tags'])
+    return tags.value_counts().rename_axis('Tag').reset_index(name='Product Count')
 
 def filter_products_by_tags(df, selected_tags, match_all=False):
     """Filter products based on selected tags."""
@@ -42,20 +34,19 @@ def filter_products_by_tags(df, selected_tags, match_all=False):
     # Get unique products first
     unique_products = df.drop_duplicates(subset='Handle')
     
+    # Products without tags match no tag
+    product_tags = unique_products['Tags'].fillna('').astype(str)
+    
     if match_all:
         # Products must have all selected tags
-        filtered_products = unique_products[
-            unique_products['Tags'].apply(
-                lambda x: all(tag in str(x) for tag in selected_tags)
-            )
-        ]
+        mask = pd.concat(
+            [product_tags.str.contains(re.escape(tag)) for tag in selected_tags],
+            axis=1
+        ).all(axis=1)
     else:
         # Products must have any of the selected tags
-        filtered_products = unique_products[
-            unique_products['Tags'].apply(
-                lambda x: any(tag in str(x) for tag in selected_tags)
-            )
-        ]
+        mask = product_tags.str.contains('|'.join(map(re.escape, selected_tags)))
+    filtered_products = unique_products[mask]
     
     # Return all rows for the filtered products
     return df[df['Handle'].isin(filtered_products['Handle'])]
@@ -65,7 +56,9 @@ def main():
     
     if uploaded_file is not None:
         try:
-            df = pd.read_csv(uploaded_file)
+            df = read_csv_fast(uploaded_file)
+            # Handle is the key for every groupby/isin below; categories hash it once
+            df['Handle'] = df['Handle'].astype('category')
             
             # Create tabs for different views
             tab1, tab2 = st.tabs(["Tag Analysis", "Product Search"])
@@ -148,7 +141,7 @@ def main():
                     st.subheader("Filtered Products")
                     
                     # Group by Handle and show key information
-                    product_summary = filtered_df.groupby('Handle').agg({
+                    product_summary = filtered_df.groupby('Handle', observed=True).agg({
                         'Title': 'first',
                         'Tags': 'first',
                         'Variant Price': lambda x: ', '.join(x.dropna().astype(str)),
@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime
 from itertools import product
-import io
+from utils.csv_io import read_uploaded_csv, to_csv_bytes
+from utils.variants import index_children_by_attributes, is_missing, rows_to_frame, variant_combinations
 
 st.set_page_config(
     page_title="WordPress to Shopify Converter",
@@ -15,101 +15,86 @@ st.set_page_config(
 st.title("WordPress to Shopify Product Converter")
 st.write("Upload your WordPress products CSV file to convert it to Shopify format.")
 
-def parse_images(image_str):
-    """Parse image string into list of dictionaries containing URL and alt text."""
-    if pd.isna(image_str):
-        return []
+def parse_images(image_col):
+    """Parse an images column into lists of URL/alt dicts keyed by row index."""
+    values = image_col.dropna().astype(str)
+    # Children often repeat their parent's images, so parse each distinct string once
+    unique_values = pd.Series(values.unique())
+    entries = unique_values.str.split('|').explode().str.strip()
+    entries = entries[entries != '']
     
-    images = []
-    for img in image_str.split('|'):
-        img = img.strip()
-        if not img:
-            continue
-            
-        parts = img.split('!')
-        url = parts[0].strip()
-        alt_text = ''
-        for part in parts[1:]:
-            if part.strip().startswith('alt :'):
-                alt_text = part.replace('alt :', '').strip()
-                break
-                
-        images.append({'url': url, 'alt': alt_text})
-    return images
-
-def extract_tags(category_str, single_tag_mode=False):
-    """Extract tags from the tax:product_cat column."""
-    if pd.isna(category_str):
-        return []
+    # One regex scan per entry: the URL runs up to the first '!', alt text is
+    # the first '!'-separated part starting with 'alt :'
+    parts = entries.str.extract(r'^([^!]*)(?:[\s\S]*?!\s*alt :([^!]*))?')
+    urls = parts[0].str.strip()
+    alts = parts[1].fillna('').str.replace('alt :', '', regex=False).str.strip()
     
-    tags = []
-    for category in category_str.split('|'):
-        parts = [p.strip() for p in category.split('>')]
-        if single_tag_mode:
-            if len(parts) >= 2:
-                tag = parts[1].strip()
-                if tag:
-                    tags.append(tag)
-        else:
-            if parts:
-                tag = parts[-1].strip()
-                if tag:
-                    tags.append(tag)
+    parsed = [[] for _ in range(len(unique_values))]
+    for pos, url, alt_text in zip(entries.index, urls, alts):
+        parsed[pos].append({'url': url, 'alt': alt_text})
     
-    return ', '.join(sorted(set(tags)))
+    # Rows without an images value get no entry
+    parsed_by_value = dict(zip(unique_values, parsed))
+    return {idx: parsed_by_value[value] for idx, value in values.items()}
+
+def extract_tags(category_col, single_tag_mode=False):
+    """Extract comma-joined tags per row from the tax:product_cat column."""
+    categories = category_col.dropna().astype(str)
+    # Products share a handful of category paths, so parse each distinct one once
+    unique_categories = pd.Series(categories.unique())
+    parts = unique_categories.str.split('|').explode().str.split('>')
+    tags = (parts.str[1] if single_tag_mode else parts.str[-1]).str.strip()
+    tags = tags[tags.notna() & (tags != '')]
+    
+    joined = tags.groupby(level=0).agg(lambda row_tags: ', '.join(sorted(set(row_tags))))
+    joined_by_category = dict(zip(unique_categories[joined.index], joined))
+    return {idx: joined_by_category.get(category, '') for idx, category in categories.items()}
 
 def get_attribute_columns(df):
     """Get all meta:attribute_pa columns except brand that have values in children."""
     meta_cols = [col for col in df.columns if col.startswith('meta:attribute_pa_') and col != 'meta:attribute_pa_brand']
-    valid_attrs = []
     
-    for col in meta_cols:
-        # Check if children have values for this attribute
-        children_df = df[~pd.isna(df['post_parent'])]
-        if not children_df.empty and col in children_df.columns:
-            if children_df[col].notna().any():
-                valid_attrs.append(col.replace('meta:attribute_pa_', ''))
+    # Check which attributes have values in any child, all columns at once
+    children_df = df[df['post_parent'].notna()]
+    has_values = children_df[meta_cols].notna().any()
+    valid_attrs = [col.replace('meta:attribute_pa_', '') for col in meta_cols if has_values[col]]
     
     return sorted(valid_attrs)
 
-def get_option_values(children_df, option_name):
-    """Get all unique values for an option from children rows."""
-    col_name = f'meta:attribute_pa_{option_name}'
-    values = set()
-    for _, row in children_df.iterrows():
-        if col_name in row and not pd.isna(row[col_name]):
-            try:
-                if isinstance(row[col_name], (int, float)):
-                    values.add(str(int(row[col_name])))
-                else:
-                    vals = [v.strip() for v in str(row[col_name]).split('|') if v.strip()]
-                    values.update(vals)
-            except:
-                if row[col_name]:
-                    values.add(str(row[col_name]))
-    return sorted(list(values))
+def get_option_values(children_df, attribute_cols):
+    """Get all unique values per parent for each option from children rows."""
+    option_values = {}
+    children_df = children_df.set_index('post_parent')
+    for attr in attribute_cols:
+        values = children_df[f'meta:attribute_pa_{attr}'].dropna()
+        if pd.api.types.is_numeric_dtype(values):
+            # Numeric attributes drop their decimals, e.g. 2.0 -> '2'
+            values = values.astype(int).astype(str)
+        else:
+            values = values.astype(str).str.split('|').explode().str.strip()
+            values = values[values != '']
+        for parent_id, unique_values in values.groupby(level=0, sort=False).unique().items():
+            option_values.setdefault(parent_id, {})[attr] = sorted(unique_values)
+    return option_values
 
-def get_variant_image(variant_row, parent_images, attribute_values, previous_image=''):
+def get_variant_image(variant_images, parent_urls, image_positions, attribute_values, previous_image=''):
     """
     Get the appropriate image URL for a variant with cascading fallback logic.
     Args:
-        variant_row: The current variant row
-        parent_images: List of parent product images
+        variant_images: Parsed images of the current variant row, or None
+        parent_urls: (url, lowercased url) pairs of the parent product images
+        image_positions: Position of the first parent image matching each attribute value
         attribute_values: List of attribute values for matching
         previous_image: Image URL from the previous variant row (default empty)
     """
     # First try to get variant's own image
-    if not pd.isna(variant_row['images']):
-        variant_images = parse_images(variant_row['images'])
-        if variant_images:
-            return variant_images[0]['url']
+    if variant_images:
+        return variant_images[0]['url']
     
-    # Then try to find matching parent image based on attributes
-    for img in parent_images:
-        img_url = img['url'].lower()
-        for attr_val in attribute_values:
-            if str(attr_val).lower() in img_url:
-                return img['url']
+    # Then take the first parent image matching any of the attributes
+    positions = [image_positions[attr_val] for attr_val in attribute_values if attr_val in image_positions]
+    if positions:
+        return parent_urls[min(positions)][0]
     
     # If no match found, return previous image if available
     if previous_image:
@@ -126,35 +111,47 @@ def get_brand_from_children(children_df, parent_row):
             return brand_values.iloc[0]
     return ''
 
-def create_variant_rows(parent_row, children_df, attribute_cols, single_tag=None):
+def child_match_keys(variant_values):
+    """Lookup keys a child can be indexed under to match these option values."""
+    if len(variant_values) == 1:
+        return ((str(variant_values[0]),), (None,))
+    if len(variant_values) == 2:
+        first, second = str(variant_values[0]), str(variant_values[1])
+        return ((first, second), (first, None), (None, second), (None, None))
+    return product(*[(str(value), None) for value in variant_values])
+
+def create_variant_rows(parent_row, children_df, attribute_values, parent_images, tags, images_by_row, single_tag=None):
     """Create variant rows with comprehensive attribute processing."""
     brand_value = get_brand_from_children(children_df, parent_row)
     base_row = {
         'Handle': parent_row['post_title'],
         'Title': parent_row['post_title'],
-        'Body (HTML)': parent_row['post_excerpt'] if not pd.isna(parent_row['post_excerpt']) else '',
+        'Body (HTML)': parent_row['post_excerpt'] if not is_missing(parent_row['post_excerpt']) else '',
         'Published': str(parent_row['post_status'] == 'publish').lower(),
-        'Tags': single_tag if single_tag else extract_tags(parent_row.get('tax:product_cat', '')),
+        'Tags': single_tag if single_tag else tags,
         'Brand (product.metafields.custom.brand)': brand_value
     }
     
-    parent_images = parse_images(parent_row['images'])
     rows = []
-    previous_variant_data = {
-        'Variant Price': parent_row['regular_price'] if not pd.isna(parent_row['regular_price']) else '',
-        'Variant Compare At Price': parent_row['sale_price'] if not pd.isna(parent_row['sale_price']) else '',
-        'Variant Image': ''
-    }
-    
-    # Get all attribute values
-    attribute_values = {}
-    for attr in attribute_cols:
-        values = get_option_values(children_df, attr)
-        if values:
-            attribute_values[attr] = values
+    # Previous variant's price, compare-at price and image, inherited by the next
+    prev_price = parent_row['regular_price'] if not is_missing(parent_row['regular_price']) else ''
+    prev_compare = parent_row['sale_price'] if not is_missing(parent_row['sale_price']) else ''
+    prev_image = ''
     
     # Create first row with parent data
     first_row = base_row.copy()
+    # Lowercase parent URLs once for attribute matching in every variant
+    parent_urls = [(img['url'], img['url'].lower()) for img in parent_images]
+    # Scan the parent images once per option value, not once per variant
+    image_positions = {}
+    for values in attribute_values.values():
+        for value in values:
+            value_lower = str(value).lower()
+            for pos, (_, url_lower) in enumerate(parent_urls):
+                if value_lower in url_lower:
+                    image_positions[value] = pos
+                    break
+    
     if parent_images:
         first_row['Image Src'] = parent_images[0]['url']
         first_row['Image Alt Text'] = parent_images[0]['alt']
@@ -163,19 +160,17 @@ def create_variant_rows(parent_row, children_df, attribute_cols, single_tag=None
     # If there are children, use first child's data, otherwise use parent's data
     if not children_df.empty:
         first_variant = children_df.iloc[0]
-        first_row['Variant Price'] = first_variant['regular_price'] if not pd.isna(first_variant['regular_price']) else previous_variant_data['Variant Price']
-        first_row['Variant Compare At Price'] = first_variant['sale_price'] if not pd.isna(first_variant['sale_price']) else previous_variant_data['Variant Compare At Price']
+        if not is_missing(first_variant['regular_price']):
+            prev_price = first_variant['regular_price']
+        if not is_missing(first_variant['sale_price']):
+            prev_compare = first_variant['sale_price']
+        first_row['Variant Price'] = prev_price
+        first_row['Variant Compare At Price'] = prev_compare
         
-        variant_image = get_variant_image(first_variant, parent_images, [], '')
+        variant_image = get_variant_image(images_by_row.get(first_variant.name), parent_urls, image_positions, [], '')
         if variant_image:
             first_row['Variant Image'] = variant_image
-            
-        # Update previous variant data
-        previous_variant_data = {
-            'Variant Price': first_row.get('Variant Price', ''),
-            'Variant Compare At Price': first_row.get('Variant Compare At Price', ''),
-            'Variant Image': first_row.get('Variant Image', '')
-        }
+            prev_image = variant_image
         
         # Add options from first variant
         for idx, (attr_name, values) in enumerate(attribute_values.items(), 1):
@@ -183,8 +178,8 @@ def create_variant_rows(parent_row, children_df, attribute_cols, single_tag=None
             first_row[f'Option{idx} Value'] = values[0]
     else:
         # Use parent data if no children
-        first_row['Variant Price'] = previous_variant_data['Variant Price']
-        first_row['Variant Compare At Price'] = previous_variant_data['Variant Compare At Price']
+        first_row['Variant Price'] = prev_price
+        first_row['Variant Compare At Price'] = prev_compare
     
     rows.append(first_row)
     
@@ -205,110 +200,120 @@ def create_variant_rows(parent_row, children_df, attribute_cols, single_tag=None
         attr_names = list(attribute_values.keys())
         attr_values = list(attribute_values.values())
         
-        for variant_values in product(*attr_values):
-            # Skip first combination as it's already handled
-            if variant_values == tuple(v[0] for v in attr_values):
-                continue
-                
-            variant_row = base_row.copy()
-            
+        child_lookup = index_children_by_attributes(children_df, attr_names)
+        option_keys = [
+            (f'Option{idx} Name', name.capitalize(), f'Option{idx} Value')
+            for idx, name in enumerate(attr_names, 1)
+        ]
+        handle = base_row['Handle']
+        body = base_row['Body (HTML)']
+        published = base_row['Published']
+        tags_value = base_row['Tags']
+        
+        for variant_values in variant_combinations(attr_values):
             # Find matching child row for pricing
-            matching_child = None
-            for _, child in children_df.iterrows():
-                matches = True
-                for attr_name, value in zip(attr_names, variant_values):
-                    col_name = f'meta:attribute_pa_{attr_name}'
-                    if col_name in child and not pd.isna(child[col_name]):
-                        child_value = str(child[col_name])
-                        if '|' in child_value:
-                            child_values = [v.strip() for v in child_value.split('|')]
-                        else:
-                            child_values = [child_value]
-                        if str(value) not in child_values:
-                            matches = False
-                            break
-                if matches:
-                    matching_child = child
-                    break
+            # A child matches on its own values or on attributes it leaves empty
+            candidates = [
+                child_lookup[key]
+                for key in child_match_keys(variant_values)
+                if key in child_lookup
+            ]
+            matching_child = children_df.iloc[min(candidates)] if candidates else None
             
-            # If we have matching child data, use it
+            # If we have matching child data, use it, else keep the previous variant's
             if matching_child is not None:
-                variant_row['Variant Price'] = matching_child['regular_price'] if not pd.isna(matching_child['regular_price']) else previous_variant_data['Variant Price']
-                variant_row['Variant Compare At Price'] = matching_child['sale_price'] if not pd.isna(matching_child['sale_price']) else previous_variant_data['Variant Compare At Price']
-                variant_image = get_variant_image(matching_child, parent_images, variant_values, previous_variant_data['Variant Image'])
-                if variant_image:
-                    variant_row['Variant Image'] = variant_image
-            else:
-                # If no matching child found, use previous variant's data
-                variant_row['Variant Price'] = previous_variant_data['Variant Price']
-                variant_row['Variant Compare At Price'] = previous_variant_data['Variant Compare At Price']
-                variant_row['Variant Image'] = previous_variant_data['Variant Image']
+                if not is_missing(matching_child['regular_price']):
+                    prev_price = matching_child['regular_price']
+                if not is_missing(matching_child['sale_price']):
+                    prev_compare = matching_child['sale_price']
             
-            # Update previous variant data
-            previous_variant_data = {
-                'Variant Price': variant_row.get('Variant Price', ''),
-                'Variant Compare At Price': variant_row.get('Variant Compare At Price', ''),
-                'Variant Image': variant_row.get('Variant Image', '')
+            # Fresh row with the product fields instead of copying base_row
+            variant_row = {
+                'Handle': handle,
+                'Title': handle,
+                'Body (HTML)': body,
+                'Published': published,
+                'Tags': tags_value,
+                'Brand (product.metafields.custom.brand)': brand_value,
+                'Variant Price': prev_price,
+                'Variant Compare At Price': prev_compare
             }
+            if matching_child is not None:
+                prev_image = get_variant_image(
+                    images_by_row.get(matching_child.name), parent_urls, image_positions, variant_values, prev_image
+                ) or ''
+                if prev_image:
+                    variant_row['Variant Image'] = prev_image
+            else:
+                variant_row['Variant Image'] = prev_image
             
             # Add option values
-            for idx, (name, value) in enumerate(zip(attr_names, variant_values), 1):
-                variant_row[f'Option{idx} Name'] = name.capitalize()
-                variant_row[f'Option{idx} Value'] = value
+            for (name_key, name, value_key), value in zip(option_keys, variant_values):
+                variant_row[name_key] = name
+                variant_row[value_key] = value
             
             rows.append(variant_row)
     
     return rows
 
+@st.cache_data(show_spinner="Converting products...")
 def convert_wordpress_to_shopify(df, single_tag_mode=False):
     """Main conversion function."""
     parent_products = df[pd.isna(df['post_parent'])]
     attribute_cols = get_attribute_columns(df)
+    children_df = df[df['post_parent'].notna()]
+    # Keep only the columns variant rows read, so per-child row lookups stay cheap
+    child_cols = ['post_parent', 'regular_price', 'sale_price'] + [
+        f'meta:attribute_pa_{attr}' for attr in attribute_cols
+    ]
+    if 'meta:attribute_pa_brand' in df.columns:
+        child_cols.append('meta:attribute_pa_brand')
+    # Group children once instead of scanning the whole frame for every parent
+    children_by_parent = {
+        parent_id: children
+        for parent_id, children in children_df[child_cols].groupby('post_parent', sort=False)
+    }
+    no_children = children_df[child_cols].iloc[0:0]
+    option_values = get_option_values(children_df, attribute_cols)
+    
+    # Parse every images and category string up front
+    images_by_row = parse_images(df['images'])
+    tags_by_row = extract_tags(parent_products['tax:product_cat'])
     
     output_rows = []
-    progress_bar = st.progress(0)
-    total_products = len(parent_products)
     
-    for idx, (_, parent_row) in enumerate(parent_products.iterrows()):
-        children = df[df['post_parent'] == parent_row['ID']]
-        product_rows = create_variant_rows(parent_row, children, attribute_cols)
+    # Plain dicts keep parent_row['...'] lookups without building a Series per row
+    for row_idx, parent_row in parent_products.to_dict('index').items():
+        children = children_by_parent.get(parent_row['ID'], no_children)
+        product_rows = create_variant_rows(
+            parent_row, children, option_values.get(parent_row['ID'], {}),
+            images_by_row.get(row_idx, []), tags_by_row.get(row_idx, []), images_by_row
+        )
         output_rows.extend(product_rows)
-        progress = (idx + 1) / total_products
-        progress_bar.progress(progress)
     
-    output_df = pd.DataFrame(output_rows)
-    progress_bar.empty()
-    
-    return output_df
+    return rows_to_frame(output_rows)
 
 def show_statistics(output_df):
     """Display statistics about the conversion."""
     st.subheader("Conversion Statistics")
     col1, col2, col3 = st.columns(3)
     
-    unique_products = len(output_df['Handle'].unique())
+    unique_products = output_df['Handle'].nunique()
     
     with col1:
         st.metric("Total Unique Products", unique_products)
     
     st.subheader("Detailed Product Breakdown")
-    product_breakdown = []
-    for handle in output_df['Handle'].unique():
-        product_rows = output_df[output_df['Handle'] == handle]
-        variant_rows = product_rows[product_rows['Variant Price'].notna()].shape[0]
-        image_rows = product_rows[product_rows['Image Position'].notna()].shape[0]
-        
-        product_breakdown.append({
-            'Handle': handle,
-            'Title': product_rows['Title'].iloc[0] if 'Title' in product_rows else 'N/A',
-            'Variants': variant_rows,
-            'Images': image_rows,
-            'Total Rows': len(product_rows),
-            'Tags': product_rows['Tags'].iloc[0] if 'Tags' in product_rows else '',
-            'Brand': product_rows['Brand (product.metafields.custom.brand)'].iloc[0] if 'Brand (product.metafields.custom.brand)' in product_rows else ''
-        })
-    
-    breakdown_df = pd.DataFrame(product_breakdown)
+    handles = output_df['Handle']
+    first_rows = output_df.groupby('Handle', sort=False, observed=True).head(1).set_index('Handle')
+    breakdown_df = pd.DataFrame({
+        'Title': first_rows['Title'] if 'Title' in output_df else 'N/A',
+        'Variants': output_df['Variant Price'].notna().groupby(handles, sort=False, observed=True).sum(),
+        'Images': output_df['Image Position'].notna().groupby(handles, sort=False, observed=True).sum(),
+        'Total Rows': handles.groupby(handles, sort=False, observed=True).size(),
+        'Tags': first_rows['Tags'] if 'Tags' in output_df else '',
+        'Brand': first_rows['Brand (product.metafields.custom.brand)'] if 'Brand (product.metafields.custom.brand)' in output_df else ''
+    }).rename_axis('Handle').reset_index()
     st.dataframe(
         breakdown_df,
         column_config={
@@ -329,13 +334,19 @@ def main():
     if uploaded_file is not None:
         try:
             st.info("Processing uploaded file...")
-            df = pd.read_csv(uploaded_file)
+            # Reruns with the same upload reuse the parsed frame
+            df = read_uploaded_csv(uploaded_file.getvalue())
             
             with st.expander("View Input Data Preview", expanded=True):
                 st.dataframe(df, height=400)
             
             if st.button("Convert to Shopify Format"):
                 output_df = convert_wordpress_to_shopify(df)
+                # Highly repeated text columns are stored once per distinct value.
+                # Tags is left out: products without a category carry a list there
+                for col in ('Handle', 'Published', 'Brand (product.metafields.custom.brand)'):
+                    if col in output_df:
+                        output_df[col] = output_df[col].astype('category')
                 st.session_state['output_df'] = output_df
                 
                 show_statistics(output_df)
@@ -346,10 +357,9 @@ def main():
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 output_filename = f'wordpress_to_shopify_{timestamp}.csv'
                 
-                csv = output_df.to_csv(index=False)
                 st.download_button(
                     label="Download Converted CSV",
-                    data=csv,
+                    data=to_csv_bytes(output_df),
                     file_name=output_filename,
                     mime='text/csv'
                 )
@@ -1,9 +1,11 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime
 from itertools import product
+from functools import lru_cache
 import io
+from utils.csv_io import to_csv_bytes
+from utils.variants import index_children_by_attributes, is_missing, rows_to_frame, variant_combinations
 
 st.set_page_config(
     page_title="WordPress to Shopify Converter",
@@ -15,10 +17,14 @@ st.title("WordPress to Shopify Product Converter")
 st.write("Upload your WordPress products CSV file to convert it to Shopify format.")
 
 def parse_images(image_str):
-    """Parse image string into list of dictionaries containing URL and alt text."""
-    if pd.isna(image_str):
-        return []
-    
+    """Parse image string into a tuple of (url, alt) pairs."""
+    if is_missing(image_str):
+        return ()
+    return parse_image_string(image_str)
+
+@lru_cache(maxsize=4096)
+def parse_image_string(image_str):
+    """Split a non-missing images value into (url, alt) pairs, cached since values repeat across rows."""
     images = []
     for img in image_str.split('|'):
         img = img.strip()
@@ -33,48 +39,30 @@ def parse_images(image_str):
                 alt_text = part.replace('alt :', '').strip()
                 break
                 
-        images.append({'url': url, 'alt': alt_text})
-    return images
+        images.append((url, alt_text))
+    return tuple(images)
 
-def extract_tags(category_str, single_tag_mode=False):
-    """Extract tags from the tax:product_cat column."""
-    if pd.isna(category_str):
-        return []
-    
-    tags = []
-    for category in category_str.split('|'):
-        parts = [p.strip() for p in category.split('>')]
-        if single_tag_mode:
-            if len(parts) >= 2:
-                tag = parts[1].strip()
-                if tag:
-                    tags.append(tag)
-        else:
-            if parts:
-                tag = parts[-1].strip()
-                if tag:
-                    tags.append(tag)
-    
-    return ', '.join(sorted(set(tags)))
+def extract_tags(category_col, single_tag_mode=False):
+    """Extract comma-joined tags per row from the tax:product_cat column."""
+    categories = category_col.dropna()
+    parts = categories.astype(str).str.split('|').explode().str.split('>')
+    tags = (parts.str[1] if single_tag_mode else parts.str[-1]).str.strip()
+    tags = tags[tags.notna() & (tags != '')]
+    
+    joined = tags.groupby(level=0).agg(lambda row_tags: ', '.join(sorted(set(row_tags))))
+    return {idx: joined.get(idx, '') for idx in categories.index}
 
-def get_metafield_values(children_df, attr_name):
-    """Get all unique values for a metafield attribute from children rows."""
-    values = set()
-    
-    # First check children rows
-    if not children_df.empty and attr_name in children_df.columns:
-        for _, row in children_df.iterrows():
-            if not pd.isna(row[attr_name]):
-                # Handle pipe-separated values
-                if isinstance(row[attr_name], str) and '|' in row[attr_name]:
-                    values.update(v.strip() for v in row[attr_name].split('|') if v.strip())
-                else:
-                    # Handle single values
-                    val = str(row[attr_name]).strip()
-                    if val:
-                        values.add(val)
-    
-    return sorted(list(values))
+def get_metafield_values(children_df, metafield_attrs):
+    """Get all unique values per parent for each metafield attribute from children rows."""
+    metafield_values = {}
+    children_df = children_df.set_index('post_parent')
+    for attr in metafield_attrs:
+        # Split pipe-separated values on the whole column at once
+        values = children_df[attr['original']].dropna().astype(str).str.split('|').explode().str.strip()
+        values = values[values != '']
+        for parent_id, unique_values in values.groupby(level=0, sort=False).unique().items():
+            metafield_values.setdefault(parent_id, {})[attr['original']] = sorted(unique_values)
+    return metafield_values
 
 
 def get_metafield_attributes(df):
@@ -99,96 +87,83 @@ def get_metafield_attributes(df):
 def get_variant_attributes(df):
     """Get attributes that should be used as variants (size, color, etc.)."""
     variant_attrs = ['size', 'sizes', 'color']  # Add more variant attributes as needed
-    meta_cols = [col for col in df.columns if col.startswith('meta:attribute_pa_')]
-    valid_attrs = []
+    meta_cols = [
+        col for col in df.columns
+        if col.startswith('meta:attribute_pa_') and col.replace('meta:attribute_pa_', '').lower() in variant_attrs
+    ]
     
-    for col in meta_cols:
-        attr_name = col.replace('meta:attribute_pa_', '')
-        if attr_name.lower() in variant_attrs:
-            children_df = df[~pd.isna(df['post_parent'])]
-            if not children_df.empty and col in children_df.columns:
-                if children_df[col].notna().any():
-                    valid_attrs.append(attr_name)
+    # One notna().any() over the child rows covers every attribute column
+    has_values = df.loc[df['post_parent'].notna(), meta_cols].notna().any()
+    valid_attrs = [col.replace('meta:attribute_pa_', '') for col in meta_cols if has_values[col]]
     
     return sorted(valid_attrs)
 
-def get_option_values(children_df, option_name):
-    """Get all unique values for an option from children rows."""
-    col_name = f'meta:attribute_pa_{option_name}'
-    values = set()
-    for _, row in children_df.iterrows():
-        if col_name in row and not pd.isna(row[col_name]):
-            try:
-                if isinstance(row[col_name], (int, float)):
-                    values.add(str(int(row[col_name])))
-                else:
-                    vals = [v.strip() for v in str(row[col_name]).split('|') if v.strip()]
-                    values.update(vals)
-            except:
-                if row[col_name]:
-                    values.add(str(row[col_name]))
-    return sorted(list(values))
+def get_option_values(children_df, variant_attrs):
+    """Get all unique values per parent for each option from children rows."""
+    option_values = {}
+    children_df = children_df.set_index('post_parent')
+    for attr in variant_attrs:
+        values = children_df[f'meta:attribute_pa_{attr}'].dropna()
+        if pd.api.types.is_numeric_dtype(values):
+            # Whole-number floats such as 2.0 become '2'
+            values = values.astype(int).astype(str)
+        else:
+            values = values.astype(str).str.split('|').explode().str.strip()
+            values = values[values != '']
+        for parent_id, unique_values in values.groupby(level=0, sort=False).unique().items():
+            option_values.setdefault(parent_id, {})[attr] = sorted(unique_values)
+    return option_values
 
-def get_variant_image(variant_row, parent_images, attribute_values, previous_image=''):
+def get_variant_image(variant_row, parent_urls, image_positions, attribute_values, previous_image=''):
     """Get the appropriate image URL for a variant with cascading fallback logic."""
-    if not pd.isna(variant_row['images']):
+    if not is_missing(variant_row['images']):
         variant_images = parse_images(variant_row['images'])
         if variant_images:
-            return variant_images[0]['url']
+            return variant_images[0][0]
     
-    for img in parent_images:
-        img_url = img['url'].lower()
-        for attr_val in attribute_values:
-            if str(attr_val).lower() in img_url:
-                return img['url']
+    # The first parent image matching any of the values is the earliest of their first matches
+    positions = [image_positions[attr_val] for attr_val in attribute_values if attr_val in image_positions]
+    if positions:
+        return parent_urls[min(positions)][0]
     
     return previous_image if previous_image else ''
 
-def extract_category_info(category_str):
-    """Extract category and subcategory from tax:product_cat."""
-    if pd.isna(category_str):
-        return {'category': '', 'subcategory': ''}
-    
-    categories = []
-    for category in category_str.split('|'):
-        parts = [p.strip() for p in category.split('>')]
-        if len(parts) >= 3:  # At least: All Products > Category > Subcategory
-            categories.append({
-                'category': parts[1].strip(),
-                'subcategory': parts[2].strip()
-            })
-    
-    if categories:
-        # Take the first valid category-subcategory pair
-        return categories[0]
-    return {'category': '', 'subcategory': ''}
+def extract_category_info(category_col):
+    """Extract category and subcategory per row from the tax:product_cat column."""
+    parts = category_col.dropna().astype(str).str.split('|').explode().str.split('>')
+    # At least: All Products > Category > Subcategory
+    parts = parts[parts.str.len() >= 3]
+    # Take the first valid category-subcategory pair
+    parts = parts[~parts.index.duplicated()]
+    
+    return {
+        idx: {'category': category, 'subcategory': subcategory}
+        for idx, category, subcategory in zip(parts.index, parts.str[1].str.strip(), parts.str[2].str.strip())
+    }
 
-def create_variant_rows(parent_row, children_df, variant_attrs, metafield_attrs):
+def create_variant_rows(parent_row, children_df, attribute_values, metafield_attrs, metafield_values, tags, category_info):
     """Create variant rows with comprehensive attribute processing."""
-    # Extract category info
-    category_info = extract_category_info(parent_row.get('tax:product_cat', ''))
-    
     # Create base row
     base_row = {
         'Handle': parent_row['post_title'],
         'Title': parent_row['post_title'],
-        'Body (HTML)': parent_row['post_excerpt'] if not pd.isna(parent_row['post_excerpt']) else '',
+        'Body (HTML)': parent_row['post_excerpt'] if not is_missing(parent_row['post_excerpt']) else '',
         'Published': str(parent_row['post_status'] == 'publish').lower(),
-        'Tags': extract_tags(parent_row.get('tax:product_cat', '')),
+        'Tags': tags,
         'Category (product.metafields.custom.category)': category_info['category'],
         'Sub Category (product.metafields.custom.sub_category)': category_info['subcategory']
     }
     
     # Add metafield attributes with all unique values
     for attr in metafield_attrs:
-        values = get_metafield_values(children_df, attr['original'])
+        values = metafield_values.get(attr['original'])
         if values:
             # Join values with newline character for multi-line display
             base_row[attr['field_name']] = '\n'.join(values)
         else:
             # If no values in children, check parent
             parent_value = parent_row.get(attr['original'], '')
-            if not pd.isna(parent_value):
+            if not is_missing(parent_value):
                 if isinstance(parent_value, str) and '|' in parent_value:
                     values = [v.strip() for v in parent_value.split('|') if v.strip()]
                     base_row[attr['field_name']] = '\n'.join(sorted(values))
@@ -198,37 +173,38 @@ def create_variant_rows(parent_row, children_df, variant_attrs, metafield_attrs)
                 base_row[attr['field_name']] = ''
     
     parent_images = parse_images(parent_row['images'])
+    parent_urls = [(url, url.lower()) for url, _ in parent_images]
+    # Each option value is matched against the parent images only once
+    image_positions = {}
+    for values in attribute_values.values():
+        for value in values:
+            value_lower = str(value).lower()
+            for pos, (_, url_lower) in enumerate(parent_urls):
+                if value_lower in url_lower:
+                    image_positions[value] = pos
+                    break
     rows = []
     previous_variant_data = {
-        'Variant Price': parent_row['regular_price'] if not pd.isna(parent_row['regular_price']) else '',
-        'Variant Compare At Price': parent_row['sale_price'] if not pd.isna(parent_row['sale_price']) else '',
+        'Variant Price': parent_row['regular_price'] if not is_missing(parent_row['regular_price']) else '',
+        'Variant Compare At Price': parent_row['sale_price'] if not is_missing(parent_row['sale_price']) else '',
         'Variant Image': ''
     }
     
-    # Get all attribute values for variants
-    attribute_values = {}
-    for attr in variant_attrs:
-        values = get_option_values(children_df, attr)
-        if values:
-            attribute_values[attr] = values
-    
     # Create first row with parent data
     first_row = base_row.copy()
     if parent_images:
-        first_row['Image Src'] = parent_images[0]['url']
-        first_row['Image Alt Text'] = parent_images[0]['alt']
+        first_row['Image Src'], first_row['Image Alt Text'] = parent_images[0]
         first_row['Image Position'] = 1
     
     # Handle variant data
     if not children_df.empty:
         first_variant = children_df.iloc[0]
-        first_row['Variant Price'] = first_variant['sale_price'] if not pd.isna(first_variant['sale_price']) else \
-                                   first_variant['regular_price'] if not pd.isna(first_variant['regular_price']) else \
+        first_row['Variant Price'] = first_variant['variant_price'] if not is_missing(first_variant['variant_price']) else \
                                    previous_variant_data['Variant Price']
-        first_row['Variant Compare At Price'] = first_variant['regular_price'] if not pd.isna(first_variant['regular_price']) else \
+        first_row['Variant Compare At Price'] = first_variant['regular_price'] if not is_missing(first_variant['regular_price']) else \
                                               previous_variant_data['Variant Compare At Price']
         
-        variant_image = get_variant_image(first_variant, parent_images, [], '')
+        variant_image = get_variant_image(first_variant, parent_urls, image_positions, [], '')
         if variant_image:
             first_row['Variant Image'] = variant_image
         
@@ -253,60 +229,47 @@ def create_variant_rows(parent_row, children_df, variant_attrs, metafield_attrs)
     
     rows.append(first_row)
     
-    # Add remaining parent images
-    for idx, img in enumerate(parent_images[1:], 2):
-        img_row = {
+    # Add remaining parent images; they all share the same tags, metafields and category
+    image_row_fields = {'Tags': base_row['Tags']}
+    for attr in metafield_attrs:
+        image_row_fields[attr['field_name']] = base_row[attr['field_name']]
+    image_row_fields['Category (product.metafields.custom.category)'] = category_info['category']
+    image_row_fields['Sub Category (product.metafields.custom.sub_category)'] = category_info['subcategory']
+    for idx, (url, alt_text) in enumerate(parent_images[1:], 2):
+        rows.append({
             'Handle': parent_row['post_title'],
-            'Image Src': img['url'],
-            'Image Alt Text': img['alt'],
+            'Image Src': url,
+            'Image Alt Text': alt_text,
             'Image Position': idx,
-            'Tags': base_row['Tags'],
-        }
-        # Add metafields to image rows
-        for attr in metafield_attrs:
-            img_row[attr['field_name']] = base_row[attr['field_name']]
-        img_row['Category (product.metafields.custom.category)'] = category_info['category']
-        img_row['Sub Category (product.metafields.custom.sub_category)'] = category_info['subcategory']
-        rows.append(img_row)
+            **image_row_fields
+        })
     
     # Create variant combinations
     if attribute_values and not children_df.empty:
         attr_names = list(attribute_values.keys())
         attr_values = list(attribute_values.values())
         
-        for variant_values in product(*attr_values):
-            if variant_values == tuple(v[0] for v in attr_values):
-                continue
-            
+        child_lookup = index_children_by_attributes(children_df, attr_names)
+        
+        for variant_values in variant_combinations(attr_values):
             variant_row = base_row.copy()
             
             # Find matching child
-            matching_child = None
-            for _, child in children_df.iterrows():
-                matches = True
-                for attr_name, value in zip(attr_names, variant_values):
-                    col_name = f'meta:attribute_pa_{attr_name}'
-                    if col_name in child and not pd.isna(child[col_name]):
-                        child_value = str(child[col_name])
-                        if '|' in child_value:
-                            child_values = [v.strip() for v in child_value.split('|')]
-                        else:
-                            child_values = [child_value]
-                        if str(value) not in child_values:
-                            matches = False
-                            break
-                if matches:
-                    matching_child = child
-                    break
+            # Look the child up by its values, falling back to attributes it leaves empty
+            candidates = [
+                child_lookup[key]
+                for key in product(*[(str(value), None) for value in variant_values])
+                if key in child_lookup
+            ]
+            matching_child = children_df.iloc[min(candidates)] if candidates else None
             
             # Set variant data
             if matching_child is not None:
-                variant_row['Variant Price'] = matching_child['sale_price'] if not pd.isna(matching_child['sale_price']) else \
-                                           matching_child['regular_price'] if not pd.isna(matching_child['regular_price']) else \
+                variant_row['Variant Price'] = matching_child['variant_price'] if not is_missing(matching_child['variant_price']) else \
                                            previous_variant_data['Variant Price']
-                variant_row['Variant Compare At Price'] = matching_child['regular_price'] if not pd.isna(matching_child['regular_price']) else \
+                variant_row['Variant Compare At Price'] = matching_child['regular_price'] if not is_missing(matching_child['regular_price']) else \
                                                       previous_variant_data['Variant Compare At Price']
-                variant_image = get_variant_image(matching_child, parent_images, variant_values, previous_variant_data['Variant Image'])
+                variant_image = get_variant_image(matching_child, parent_urls, image_positions, variant_values, previous_variant_data['Variant Image'])
                 if variant_image:
                     variant_row['Variant Image'] = variant_image
             else:
@@ -332,27 +295,48 @@ def create_variant_rows(parent_row, children_df, variant_attrs, metafield_attrs)
     
     return rows
 
+@st.cache_data(show_spinner="Converting products...")
 def convert_wordpress_to_shopify(df):
     """Main conversion function."""
     parent_products = df[pd.isna(df['post_parent'])]
     variant_attrs = get_variant_attributes(df)
     metafield_attrs = get_metafield_attributes(df)
+    children_df = df[df['post_parent'].notna()]
+    # Variant matching only reads these child columns, so matched rows stay cheap to pull out
+    child_cols = ['post_parent', 'images', 'regular_price', 'variant_price'] + [
+        f'meta:attribute_pa_{attr}' for attr in variant_attrs
+    ]
+    # Sale price falls back to regular price; coalesce both once for the whole column
+    children_df = children_df.assign(variant_price=children_df['sale_price'].fillna(children_df['regular_price']))
+    # One groupby hands each parent its children
+    children_by_parent = {
+        parent_id: children
+        for parent_id, children in children_df[child_cols].groupby('post_parent', sort=False)
+    }
+    no_children = children_df[child_cols].iloc[0:0]
+    
+    # Collect every parent's option and metafield values in one pass over the children
+    option_values = get_option_values(children_df, variant_attrs)
+    metafield_values = get_metafield_values(children_df, metafield_attrs)
+    
+    # Parse every category string up front
+    tags_by_row = extract_tags(parent_products['tax:product_cat'])
+    category_info_by_row = extract_category_info(parent_products['tax:product_cat'])
+    no_category = {'category': '', 'subcategory': ''}
     
     output_rows = []
-    progress_bar = st.progress(0)
-    total_products = len(parent_products)
     
-    for idx, (_, parent_row) in enumerate(parent_products.iterrows()):
-        children = df[df['post_parent'] == parent_row['ID']]
-        product_rows = create_variant_rows(parent_row, children, variant_attrs, metafield_attrs)
+    # to_dict rows avoid building a Series for every parent
+    for row_idx, parent_row in parent_products.to_dict('index').items():
+        children = children_by_parent.get(parent_row['ID'], no_children)
+        product_rows = create_variant_rows(
+            parent_row, children, option_values.get(parent_row['ID'], {}),
+            metafield_attrs, metafield_values.get(parent_row['ID'], {}),
+            tags_by_row.get(row_idx, []), category_info_by_row.get(row_idx, no_category)
+        )
         output_rows.extend(product_rows)
-        progress = (idx + 1) / total_products
-        progress_bar.progress(progress)
-    
-    output_df = pd.DataFrame(output_rows)
-    progress_bar.empty()
     
-    return output_df
+    return rows_to_frame(output_rows)
 
 def show_statistics(output_df):
     """Display statistics about the conversion."""
@@ -365,24 +349,18 @@ def show_statistics(output_df):
         st.metric("Total Unique Products", unique_products)
     
     st.subheader("Detailed Product Breakdown")
-    product_breakdown = []
-    for handle in output_df['Handle'].unique():
-        product_rows = output_df[output_df['Handle'] == handle]
-        variant_rows = product_rows[product_rows['Variant Price'].notna()].shape[0]
-        image_rows = product_rows[product_rows['Image Position'].notna()].shape[0]
-        
-        product_breakdown.append({
-            'Handle': handle,
-            'Title': product_rows['Title'].iloc[0] if 'Title' in product_rows else 'N/A',
-            'Variants': variant_rows,
-            'Images': image_rows,
-            'Total Rows': len(product_rows),
-            'Tags': product_rows['Tags'].iloc[0] if 'Tags' in product_rows else '',
-            'Category': product_rows['Category (product.metafields.custom.category)'].iloc[0] if 'Category (product.metafields.custom.category)' in product_rows else '',
-            'Sub Category': product_rows['Sub Category (product.metafields.custom.sub_category)'].iloc[0] if 'Sub Category (product.metafields.custom.sub_category)' in product_rows else ''
-        })
-    
-    breakdown_df = pd.DataFrame(product_breakdown)
+    # One grouped pass per column instead of filtering the frame for every handle
+    handles = output_df['Handle']
+    first_rows = output_df.groupby('Handle', sort=False).head(1).set_index('Handle')
+    breakdown_df = pd.DataFrame({
+        'Title': first_rows['Title'] if 'Title' in output_df else 'N/A',
+        'Variants': output_df['Variant Price'].notna().groupby(handles, sort=False).sum(),
+        'Images': output_df['Image Position'].notna().groupby(handles, sort=False).sum(),
+        'Total Rows': handles.groupby(handles, sort=False).size(),
+        'Tags': first_rows['Tags'] if 'Tags' in output_df else '',
+        'Category': first_rows['Category (product.metafields.custom.category)'] if 'Category (product.metafields.custom.category)' in output_df else '',
+        'Sub Category': first_rows['Sub Category (product.metafields.custom.sub_category)'] if 'Sub Category (product.metafields.custom.sub_category)' in output_df else ''
+    }).rename_axis('Handle').reset_index()
     st.dataframe(
         breakdown_df,
         column_config={
@@ -398,16 +376,27 @@ def show_statistics(output_df):
         height=400
     )
 
+@st.cache_data(show_spinner=False)
+def read_upload(file_bytes):
+    """Parse the upload once; return it whole for the preview and the columns the conversion reads."""
+    upload_df = pd.read_csv(io.BytesIO(file_bytes))
+    required_columns = [
+        'ID', 'post_parent', 'post_title', 'post_excerpt', 'post_status',
+        'tax:product_cat', 'images', 'regular_price', 'sale_price'
+    ]
+    usecols = [col for col in upload_df.columns if col in required_columns or col.startswith('meta:attribute_pa_')]
+    return upload_df, upload_df[usecols]
+
 def main():
     uploaded_file = st.file_uploader("Choose WordPress CSV file", type=['csv'])
     
     if uploaded_file is not None:
         try:
             st.info("Processing uploaded file...")
-            df = pd.read_csv(uploaded_file)
+            upload_df, df = read_upload(uploaded_file.getvalue())
             
             with st.expander("View Input Data Preview", expanded=True):
-                st.dataframe(df, height=400)
+                st.dataframe(upload_df, height=400)
             
             if st.button("Convert to Shopify Format"):
                 output_df = convert_wordpress_to_shopify(df)
@@ -421,10 +410,9 @@ def main():
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 output_filename = f'wordpress_to_shopify_{timestamp}.csv'
                 
-                csv = output_df.to_csv(index=False)
                 st.download_button(
                     label="Download Converted CSV",
-                    data=csv,
+                    data=to_csv_bytes(output_df),
                     file_name=output_filename,
                     mime='text/csv'
                 )
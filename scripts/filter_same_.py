@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+import io
 
 st.set_page_config(
     page_title="Shopify Option Optimizer",
@@ -10,51 +11,39 @@ st.set_page_config(
 
 st.title("Shopify Option Optimizer")
 
-def analyze_options(df, handle):
-    """Analyze options for a specific product to identify constant values."""
-    product_df = df[df['Handle'] == handle].copy()
-    variant_rows = product_df[product_df['Image Position'].isna()]
+def analyze_options(variant_rows):
+    """Flag, per product handle, which options keep one value across all variants."""
+    positions = [
+        i for i in range(1, 5)
+        if f'Option{i} Name' in variant_rows.columns and f'Option{i} Value' in variant_rows.columns
+    ]
     
-    options_analysis = {}
-    for i in range(1, 5):
-        option_name = f'Option{i} Name'
-        option_value = f'Option{i} Value'
-        
-        if option_name in variant_rows.columns and option_value in variant_rows.columns:
-            unique_values = variant_rows[option_value].unique()
-            if len(unique_values) == 1:  # Constant value across all variants
-                options_analysis[option_name] = {
-                    'is_constant': True,
-                    'value': unique_values[0],
-                    'original_position': i
-                }
-            else:
-                options_analysis[option_name] = {
-                    'is_constant': False,
-                    'values': sorted(unique_values),
-                    'original_position': i
-                }
-    
-    return options_analysis
+    # One grouped count over every product; a missing value counts as a value
+    value_counts = variant_rows.groupby('Handle', sort=False, observed=True)[
+        [f'Option{i} Value' for i in positions]
+    ].nunique(dropna=False)
+    is_constant = (value_counts == 1).set_axis([f'Option{i} Name' for i in positions], axis=1)
+    return is_constant.to_dict('index')
 
+@st.cache_data(show_spinner="Optimizing products...")
 def optimize_product_structure(df):
     """Optimize the product structure by reorganizing options and removing duplicates."""
     optimized_rows = []
+    options_analysis = analyze_options(df[df['Image Position'].isna()])
     
-    # Process each product separately
-    for handle in df['Handle'].unique():
-        product_df = df[df['Handle'] == handle].copy()
+    # Process each product separately, grouping once instead of masking per handle
+    for handle, product_df in df.groupby('Handle', sort=False, observed=True):
+        is_image = product_df['Image Position'].notna()
         
         # Keep all image rows unchanged
-        image_rows = product_df[product_df['Image Position'].notna()].copy()
+        image_rows = product_df[is_image]
         optimized_rows.append(image_rows)
         
         # Process variant rows
-        variant_rows = product_df[product_df['Image Position'].isna()].copy()
+        variant_rows = product_df[~is_image]
         
         if not variant_rows.empty:
-            # Analyze options
-            options_analysis = analyze_options(df, handle)
+            option_is_constant = options_analysis[handle]
             
             # Reorganize options (move non-constant options to front)
             variable_options = []
@@ -62,53 +51,42 @@ def optimize_product_structure(df):
             
             for i in range(1, 5):
                 option_name = f'Option{i} Name'
-                if option_name in options_analysis:
-                    if not options_analysis[option_name]['is_constant']:
+                if option_name in option_is_constant:
+                    if not option_is_constant[option_name]:
                         variable_options.append((option_name, f'Option{i} Value'))
                     else:
                         constant_options.append((option_name, f'Option{i} Value'))
             
-            # Create new variant rows with reorganized options
-            new_variants = []
-            seen_combinations = set()
+            # Option combination key: the stripped variable values, skipping missing ones.
+            # Each present value is terminated by a separator so keys compare like tuples
+            combination_key = pd.Series('', index=variant_rows.index)
+            for _, value_col in variable_options:
+                values = variant_rows[value_col]
+                combination_key = combination_key + (values.astype(str).str.strip() + '\x1f').where(values.notna(), '')
+            unique_variants = variant_rows[~combination_key.duplicated()]
+            new_variants = unique_variants.copy()
             
-            for _, row in variant_rows.iterrows():
-                # Create option combination key
-                combination = []
-                for _, value_col in variable_options:
-                    if pd.notna(row[value_col]):
-                        combination.append(str(row[value_col]).strip())
-                
-                combination_key = tuple(combination)
-                if combination_key not in seen_combinations:
-                    seen_combinations.add(combination_key)
-                    
-                    new_row = row.copy()
-                    
-                    # Reorder options
-                    for new_pos, (old_name, old_value) in enumerate(variable_options + constant_options, 1):
-                        new_row[f'Option{new_pos} Name'] = row[old_name]
-                        new_row[f'Option{new_pos} Value'] = row[old_value]
-                    
-                    # Clear unused option columns
-                    for i in range(len(variable_options + constant_options) + 1, 5):
-                        if f'Option{i} Name' in new_row:
-                            new_row[f'Option{i} Name'] = ''
-                        if f'Option{i} Value' in new_row:
-                            new_row[f'Option{i} Value'] = ''
-                    
-                    new_variants.append(new_row)
+            # Reorder options
+            for new_pos, (old_name, old_value) in enumerate(variable_options + constant_options, 1):
+                new_variants[f'Option{new_pos} Name'] = unique_variants[old_name]
+                new_variants[f'Option{new_pos} Value'] = unique_variants[old_value]
             
-            # Sort variants by option values
-            sorted_variants = sorted(new_variants, key=lambda x: [
-                str(x[f'Option{i} Value']) if pd.notna(x[f'Option{i} Value']) else ''
-                for i in range(1, 5)
-            ])
+            # Clear unused option columns
+            for i in range(len(variable_options + constant_options) + 1, 5):
+                if f'Option{i} Name' in new_variants:
+                    new_variants[f'Option{i} Name'] = ''
+                if f'Option{i} Value' in new_variants:
+                    new_variants[f'Option{i} Value'] = ''
             
-            optimized_rows.append(pd.DataFrame(sorted_variants))
-    
-    # Combine all rows back together
-    result_df = pd.concat(optimized_rows, ignore_index=True)
+            # Sort variants by option values, missing values sorting as ''
+            value_cols = [f'Option{i} Value' for i in range(1, 5)]
+            sort_keys = pd.DataFrame({
+                col: new_variants[col].astype(str).where(new_variants[col].notna(), '')
+                for col in value_cols
+            })
+            sort_order = sort_keys.sort_values(value_cols, kind='stable').index
+            
+            optimized_rows.append(new_variants.loc[sort_order])
     
     # Ensure all required columns are present
     standard_columns = ['Handle', 'Title', 'Body (HTML)', 'Published', 'Variant Price', 
@@ -119,12 +97,10 @@ def optimize_product_structure(df):
         option_columns.extend([f'Option{i} Name', f'Option{i} Value'])
     
     all_columns = standard_columns + option_columns
-    for col in all_columns:
-        if col not in result_df.columns:
-            result_df[col] = ''
     
-    # Reorder columns
-    result_df = result_df[all_columns]
+    # Combine all rows back together in one concat; a single reindex then
+    # orders the columns and fills any missing one with ''
+    result_df = pd.concat(optimized_rows, ignore_index=True).reindex(columns=all_columns, fill_value='')
     
     return result_df
 
@@ -143,27 +119,29 @@ def show_optimization_analysis(df, optimized_df):
     
     # Show product-by-product analysis
     st.subheader("Product Analysis")
-    analysis_data = []
+    handles = df['Handle'].unique()
     
-    for handle in df['Handle'].unique():
-        orig_count = len(df[df['Handle'] == handle])
-        opt_count = len(optimized_df[optimized_df['Handle'] == handle])
-        
-        orig_variants = len(df[(df['Handle'] == handle) & (df['Image Position'].isna())])
-        opt_variants = len(optimized_df[(optimized_df['Handle'] == handle) & 
-                                      (optimized_df['Image Position'].isna())])
-        
-        analysis_data.append({
-            'Handle': handle,
-            'Original Rows': orig_count,
-            'Optimized Rows': opt_count,
-            'Original Variants': orig_variants,
-            'Optimized Variants': opt_variants,
-            'Duplicates Removed': orig_variants - opt_variants
-        })
+    # Per-handle row and variant counts in one grouped pass per frame
+    orig_count = df.groupby('Handle', sort=False, observed=True).size().reindex(handles, fill_value=0)
+    opt_count = optimized_df.groupby('Handle', sort=False, observed=True).size().reindex(handles, fill_value=0)
+    orig_variants = df['Image Position'].isna().groupby(df['Handle'], sort=False, observed=True).sum().reindex(handles, fill_value=0)
+    opt_variants = (
+        optimized_df['Image Position'].isna()
+        .groupby(optimized_df['Handle'], sort=False, observed=True).sum()
+        .reindex(handles, fill_value=0)
+    )
+    
+    analysis_data = pd.DataFrame({
+        'Handle': handles,
+        'Original Rows': orig_count.to_numpy(),
+        'Optimized Rows': opt_count.to_numpy(),
+        'Original Variants': orig_variants.to_numpy(),
+        'Optimized Variants': opt_variants.to_numpy(),
+        'Duplicates Removed': (orig_variants - opt_variants).to_numpy()
+    })
     
     st.dataframe(
-        pd.DataFrame(analysis_data),
+        analysis_data,
         column_config={
             'Handle': 'Product Handle',
             'Original Rows': 'Original Total Rows',
@@ -175,6 +153,38 @@ def show_optimization_analysis(df, optimized_df):
         hide_index=True
     )
 
+@st.cache_data(show_spinner=False)
+def read_upload(file_bytes):
+    """Parse the upload once; return it whole for the Original Data tab and the optimizer's columns."""
+    # All columns as strings, so text like 'true' or '001' is kept verbatim
+    upload_df = pd.read_csv(io.BytesIO(file_bytes), dtype=str)
+    
+    output_columns = ['Handle', 'Title', 'Body (HTML)', 'Published', 'Variant Price',
+                      'Variant Compare At Price', 'Tags', 'Image Src', 'Image Alt Text',
+                      'Image Position']
+    for i in range(1, 5):
+        output_columns.extend([f'Option{i} Name', f'Option{i} Value'])
+    df = upload_df[[col for col in upload_df.columns if col in output_columns]].copy()
+    
+    # Numeric columns that don't fully parse stay as text
+    for col in ['Variant Price', 'Variant Compare At Price', 'Image Position']:
+        if col in df.columns:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+    
+    # The optimizer groups on Handle; categorical codes are cheaper to group on
+    if 'Handle' in df.columns:
+        df['Handle'] = df['Handle'].astype('category')
+    return upload_df, df
+
+def to_csv_bytes(df):
+    """Encode the optimized products for the download button."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
+
 def main():
     st.write("""
     This tool optimizes Shopify product CSV files by:
@@ -187,20 +197,13 @@ def main():
     
     if uploaded_file is not None:
         try:
-            # Read CSV with all columns as strings initially
-            df = pd.read_csv(uploaded_file, dtype=str)
-            
-            # Convert numeric columns where needed
-            numeric_columns = ['Variant Price', 'Variant Compare At Price', 'Image Position']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='ignore')
+            upload_df, df = read_upload(uploaded_file.getvalue())
             
             tab1, tab2 = st.tabs(["Original Data", "Optimization"])
             
             with tab1:
                 st.header("Original Data")
-                st.dataframe(df, height=400)
+                st.dataframe(upload_df, height=400)
             
             with tab2:
                 st.header("Optimize Products")
@@ -215,11 +218,10 @@ def main():
                         st.dataframe(optimized_df, height=400)
                     
                     # Create download button
-                    csv = optimized_df.to_csv(index=False)
                     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                     st.download_button(
                         label="Download Optimized CSV",
-                        data=csv,
+                        data=to_csv_bytes(optimized_df),
                         file_name=f"optimized_products_{timestamp}.csv",
                         mime='text/csv'
                     )
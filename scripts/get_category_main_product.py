@@ -1,6 +1,37 @@
 import pandas as pd
+import numpy as np
 import os
 
+def select_new_tag_products(tags, seen_tags):
+    """Pick row positions in order, each at its first tag not in seen_tags, and mark those tags seen."""
+    tags = tags.reset_index(drop=True).dropna()
+    if tags.empty:
+        return []
+    
+    # Split every product's tags in one pass: join them, split the whole string
+    # once, and label each tag with its row position by repeating the position
+    # once per comma-separated tag
+    positions = np.repeat(tags.index.to_numpy(), tags.str.count(',').to_numpy() + 1)
+    product_tags = pd.Series(','.join(tags).split(','), index=positions).str.strip()
+    product_tags = product_tags[product_tags != '']
+    
+    # Number the distinct tags so the pick loop only checks integer codes
+    tag_codes, unique_tags = pd.factorize(product_tags)
+    
+    selected_positions = []
+    selected_codes = []
+    seen = [tag in seen_tags for tag in unique_tags]
+    for position, code in zip(product_tags.index.tolist(), tag_codes.tolist()):
+        if not seen[code]:
+            # Only use this product once, even if it has multiple new tags
+            if selected_positions and selected_positions[-1] == position:
+                continue
+            seen[code] = True
+            selected_positions.append(position)
+            selected_codes.append(code)
+    seen_tags.update(unique_tags[selected_codes])
+    return selected_positions
+
 def create_category_samples(input_file, output_file='category_samples.csv'):
     """
     Create a CSV file with one parent product per unique tag from the input CSV.
@@ -9,37 +40,21 @@ def create_category_samples(input_file, output_file='category_samples.csv'):
         input_file (str): Path to input Shopify CSV file
         output_file (str): Path to output CSV file
     """
-    # Read CSV file with UTF-8 encoding
-    df = pd.read_csv(input_file, encoding='utf-8')
-    
-    # Get parent products only (rows where Title matches Handle)
-    parent_products = df[df['Title'] == df['Handle']].copy()
-    
-    # Initialize list to store one product per tag
     selected_products = []
     seen_tags = set()
     
-    # Process each parent product
-    for _, row in parent_products.iterrows():
-        if pd.isna(row['Tags']):
-            continue
+    # Read CSV file with UTF-8 encoding in blocks of rows, so only one block and
+    # the selected products are held at a time (pyarrow can't read in chunks)
+    with pd.read_csv(input_file, encoding='utf-8', chunksize=200_000) as reader:
+        for chunk in reader:
+            # Get parent products only (rows where Title matches Handle)
+            parent_products = chunk[chunk['Title'] == chunk['Handle']]
             
-        # Split tags and process each
-        tags = [tag.strip() for tag in row['Tags'].split(',')]
-        
-        # Check each tag
-        for tag in tags:
-            if tag and tag not in seen_tags:
-                # Add the tag to seen set
-                seen_tags.add(tag)
-                
-                # Create a product entry for this tag
-                product_entry = row.copy()
-                selected_products.append(product_entry)
-                break  # Only use this product once, even if it has multiple new tags
-    
-    # Create DataFrame from selected products
-    output_df = pd.DataFrame(selected_products)
+            # Pick products in order, each at its first tag not represented yet
+            selected_positions = select_new_tag_products(parent_products['Tags'], seen_tags)
+            selected_products.append(parent_products.iloc[selected_positions])
+    
+    output_df = pd.concat(selected_products)
     
     # Sort by Tags for better readability
     output_df = output_df.sort_values('Tags')
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import io
 
@@ -11,85 +12,100 @@ st.set_page_config(
 
 st.title("Shopify Product Optimizer")
 
-def get_option_combination(row):
+OPTION_CODE_COLUMNS = ['Option1 Code', 'Option2 Code', 'Option3 Code', 'Option4 Code']
+
+def get_key_columns(df):
+    """List the handle and option value columns that identify a variant."""
+    return ['Handle'] + [f'Option{i} Value' for i in range(1, 5) if f'Option{i} Value' in df.columns]
+
+def get_variant_keys(variant_rows):
     """
-    Get the combination of all option values for a row.
-    Returns tuple of (option values) which uniquely identifies a variant.
+    Encode each variant's handle and option values as integer code columns.
+    Returns the key frame and the option values its codes refer to.
     """
-    options = []
+    # Strip every option value (missing stays missing) and number the distinct
+    # values across all option columns at once; missing values get code -1
+    stripped = []
     for i in range(1, 5):  # Support up to 4 options
         value_col = f'Option{i} Value'
-        if value_col in row and pd.notna(row[value_col]):
-            options.append(str(row[value_col]).strip())
-    return tuple(options)
+        if value_col in variant_rows.columns:
+            values = variant_rows[value_col]
+            stripped.append(values.astype(str).str.strip().where(values.notna()))
+        else:
+            stripped.append(pd.Series(np.nan, index=variant_rows.index, dtype=object))
+    codes, option_values = pd.factorize(pd.concat(stripped, ignore_index=True))
+    codes = codes.reshape(4, -1).T
+    
+    # Missing values are skipped in a combination, so move present values to the
+    # front in their original order; equal combinations then have equal codes
+    codes = np.take_along_axis(codes, np.argsort(codes < 0, axis=1, kind='stable'), axis=1)
+    
+    keys = pd.DataFrame(codes, index=variant_rows.index, columns=OPTION_CODE_COLUMNS)
+    keys.insert(0, 'Handle', variant_rows['Handle'])
+    return keys, option_values
 
-def find_duplicates(df):
-    """Find duplicate variants based on handle and option combinations."""
+def summarize_duplicates(keys, option_values, handles):
+    """
+    Describe every option combination that appears more than once within a product.
+    Products are listed in order of their first row in handles (the upload's Handle column).
+    """
     duplicate_info = []
     
-    # Process each product separately
-    for handle in df['Handle'].unique():
-        product_df = df[df['Handle'] == handle].copy()
-        
-        # Skip image rows (they're not variants)
-        variant_rows = product_df[product_df['Image Position'].isna()].copy()
-        
-        if not variant_rows.empty:
-            # Create a combination key for each variant
-            variant_rows['option_key'] = variant_rows.apply(get_option_combination, axis=1)
-            
-            # Find duplicates
-            for option_key, group in variant_rows.groupby('option_key'):
-                if len(group) > 1:
-                    # This is a duplicate variant
-                    duplicate_info.append({
-                        'Handle': handle,
-                        'Options': ' / '.join(option_key),
-                        'Line Numbers': ', '.join(map(str, group.index + 2)),  # +2 for Excel-style line numbers
-                        'Duplicate Count': len(group),
-                        'Original Line': str(group.index[0] + 2)
-                    })
+    # One hash pass over the integer keys finds every repeated combination
+    duplicate_keys = keys[keys.duplicated(keep=False)]
+    
+    # Group the repeats by handle and options in one pass, then list them per product
+    # in order of appearance, with option tuples ordered as a groupby on them would.
+    # Each row gets its product's factorize code over the whole upload, which numbers
+    # products by their first row; when a product's rows are not contiguous, its
+    # first duplicate can come after another product's
+    handle_rank = pd.Series(pd.factorize(handles)[0], index=handles.index)
+    groups = sorted(
+        (handle_rank.at[index[0]], tuple(option_values[code] for code in codes if code >= 0), handle, index)
+        for (handle, *codes), index in duplicate_keys.groupby(
+            ['Handle'] + OPTION_CODE_COLUMNS, sort=False, observed=True
+        ).groups.items()
+    )
+    for _, option_key, handle, index in groups:
+        duplicate_info.append({
+            'Handle': handle,
+            'Options': ' / '.join(option_key),
+            'Line Numbers': ', '.join(map(str, index + 2)),  # +2 for Excel-style line numbers
+            'Duplicate Count': len(index),
+            'Original Line': str(index[0] + 2)
+        })
     
     return duplicate_info
 
+@st.cache_data(show_spinner="Finding duplicates...")
+def find_duplicates(df):
+    """Find duplicate variants based on handle and option combinations."""
+    # Skip image rows (they're not variants), taking only the columns that key them
+    variant_rows = df.loc[df['Image Position'].isna(), get_key_columns(df)]
+    return summarize_duplicates(*get_variant_keys(variant_rows), df['Handle'])
+
+@st.cache_data(show_spinner="Removing duplicates...")
 def optimize_products(df):
     """Remove duplicate variants while preserving product structure."""
-    optimized_rows = []
-    duplicate_info = []
+    is_variant = df['Image Position'].isna().to_numpy()
     
-    # Process each product separately
-    for handle in df['Handle'].unique():
-        product_df = df[df['Handle'] == handle].copy()
-        
-        # Keep all image rows
-        image_rows = product_df[product_df['Image Position'].notna()].copy()
-        optimized_rows.append(image_rows)
-        
-        # Process variant rows
-        variant_rows = product_df[product_df['Image Position'].isna()].copy()
-        
-        if not variant_rows.empty:
-            # Create a combination key for each variant
-            variant_rows['option_key'] = variant_rows.apply(get_option_combination, axis=1)
-            
-            # Find duplicates before removing them
-            for option_key, group in variant_rows.groupby('option_key'):
-                if len(group) > 1:
-                    duplicate_info.append({
-                        'Handle': handle,
-                        'Options': ' / '.join(option_key),
-                        'Line Numbers': ', '.join(map(str, group.index + 2)),
-                        'Duplicate Count': len(group),
-                        'Original Line': str(group.index[0] + 2)
-                    })
-            
-            # Keep only first occurrence of each variant combination
-            variant_rows = variant_rows.drop_duplicates(subset='option_key', keep='first')
-            variant_rows = variant_rows.drop('option_key', axis=1)
-            optimized_rows.append(variant_rows)
+    # Create a combination key for each variant and find duplicates before removing them;
+    # only the handle and option values are pulled out of the full frame
+    variant_rows = df.loc[is_variant, get_key_columns(df)]
+    keys, option_values = get_variant_keys(variant_rows)
+    duplicate_info = summarize_duplicates(keys, option_values, df['Handle'])
+    
+    # One mask over the whole frame: rows with a handle, minus repeated variant combinations
+    is_repeat = keys.duplicated()
+    keep_mask = df['Handle'].notna().to_numpy(copy=True)
+    keep_mask[np.flatnonzero(is_variant)[is_repeat.to_numpy()]] = False
+    kept_positions = np.flatnonzero(keep_mask)
     
-    # Combine all rows back together
-    result_df = pd.concat(optimized_rows, ignore_index=True)
+    # Group rows by product in order of appearance, image rows before variants,
+    # and take them from the frame in a single selection
+    handle_order = pd.factorize(df['Handle'].iloc[kept_positions])[0]
+    row_order = np.lexsort((is_variant[kept_positions], handle_order))
+    result_df = df.iloc[kept_positions[row_order]].reset_index(drop=True)
     
     return result_df, duplicate_info
 
@@ -125,6 +141,28 @@ def show_duplicate_analysis(duplicate_info):
             hide_index=True
         )
 
+@st.cache_data(show_spinner=False)
+def read_uploaded_csv(file_bytes):
+    """Read the uploaded CSV once per distinct file content, typing only the numeric columns."""
+    # Read text columns as strings and let the parser type the numeric ones,
+    # instead of parsing everything as text and converting afterwards.
+    # The C parser keeps text verbatim; pyarrow would infer types first
+    numeric_columns = ['Variant Price', 'Variant Compare At Price', 'Image Position']
+    header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+    dtype = {col: str for col in header if col not in numeric_columns}
+    df = pd.read_csv(io.BytesIO(file_bytes), dtype=dtype)
+    
+    # Duplicate detection groups on Handle, so keep it as categorical codes
+    if 'Handle' in df.columns:
+        df['Handle'] = df['Handle'].astype('category')
+    return df
+
+def to_csv_bytes(df):
+    """Encode the deduplicated products as CSV bytes."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
+
 def main():
     st.write("""
     This tool helps fix Shopify product CSV files with duplicate variants. 
@@ -135,14 +173,7 @@ def main():
     
     if uploaded_file is not None:
         try:
-            # Read CSV with all columns as strings initially
-            df = pd.read_csv(uploaded_file, dtype=str)
-            
-            # Convert numeric columns where needed
-            numeric_columns = ['Variant Price', 'Variant Compare At Price', 'Image Position']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='ignore')
+            df = read_uploaded_csv(uploaded_file.getvalue())
             
             # Create tabs for different views
             tab1, tab2 = st.tabs(["Duplicate Analysis", "Optimization"])
@@ -185,11 +216,10 @@ def main():
                         st.dataframe(optimized_df, height=400)
                     
                     # Create download button
-                    csv = optimized_df.to_csv(index=False)
                     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                     st.download_button(
                         label="Download Optimized CSV",
-                        data=csv,
+                        data=to_csv_bytes(optimized_df),
                         file_name=f"optimized_products_{timestamp}.csv",
                         mime='text/csv'
                     )
@@ -1,5 +1,7 @@
+import re
 import streamlit as st
 import pandas as pd
+import io
 import numpy as np
 from datetime import datetime
 
@@ -9,85 +11,77 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_data(show_spinner=False)
 def filter_products(df, filters):
     """Filter products based on specified criteria."""
-    filtered_df = df.copy()
-    product_handles = df['Handle'].unique()
-    filtered_handles = set(product_handles)
+    # Sidebar defaults filter nothing, so skip the per-product passes
+    price_filter = filters.get('price_filter')
+    if not any((
+        filters.get('variant_image_filter') in ('With Variant Images', 'Without Variant Images'),
+        price_filter in ('Zero Price Products', 'Non-Zero Price Products'),
+        price_filter == 'Price Range' and (filters.get('min_price') or filters.get('max_price')),
+        filters.get('min_variants') or filters.get('max_variants'),
+        filters.get('tags'),
+        filters.get('product_limit'),
+    )):
+        return df
+    
+    handles = df['Handle']
+    filtered_handles = set(handles.unique())
+    prices = pd.to_numeric(df['Variant Price'], errors='coerce')
     
     # Filter by variant images
-    if filters.get('variant_image_filter') == 'With Variant Images':
-        handles_with_variant_images = set()
-        for handle in product_handles:
-            product_rows = df[df['Handle'] == handle]
-            if product_rows['Variant Image'].notna().any():
-                handles_with_variant_images.add(handle)
-        filtered_handles &= handles_with_variant_images
-    elif filters.get('variant_image_filter') == 'Without Variant Images':
-        handles_without_variant_images = set()
-        for handle in product_handles:
-            product_rows = df[df['Handle'] == handle]
-            if not product_rows['Variant Image'].notna().any():
-                handles_without_variant_images.add(handle)
-        filtered_handles &= handles_without_variant_images
+    variant_image_filter = filters.get('variant_image_filter')
+    if variant_image_filter in ('With Variant Images', 'Without Variant Images'):
+        has_variant_images = df['Variant Image'].notna().groupby(handles, sort=False, observed=True).any()
+        if variant_image_filter == 'Without Variant Images':
+            has_variant_images = ~has_variant_images
+        filtered_handles &= set(has_variant_images.index[has_variant_images])
 
     # Filter by zero price
-    if filters.get('price_filter') == 'Zero Price Products':
-        handles_with_zero_price = set()
-        for handle in product_handles:
-            product_rows = df[df['Handle'] == handle]
-            prices = pd.to_numeric(product_rows['Variant Price'], errors='coerce')
-            if prices.eq(0).any() or prices.isna().all():
-                handles_with_zero_price.add(handle)
-        filtered_handles &= handles_with_zero_price
-    elif filters.get('price_filter') == 'Non-Zero Price Products':
-        handles_with_nonzero_price = set()
-        for handle in product_handles:
-            product_rows = df[df['Handle'] == handle]
-            prices = pd.to_numeric(product_rows['Variant Price'], errors='coerce')
-            if (prices > 0).any():
-                handles_with_nonzero_price.add(handle)
-        filtered_handles &= handles_with_nonzero_price
+    if price_filter == 'Zero Price Products':
+        has_zero_price = (
+            prices.eq(0).groupby(handles, sort=False, observed=True).any() |
+            prices.isna().groupby(handles, sort=False, observed=True).all()
+        )
+        filtered_handles &= set(has_zero_price.index[has_zero_price])
+    elif price_filter == 'Non-Zero Price Products':
+        has_nonzero_price = (prices > 0).groupby(handles, sort=False, observed=True).any()
+        filtered_handles &= set(has_nonzero_price.index[has_nonzero_price])
     # Filter by price range (only if not filtering by zero/non-zero)
-    elif filters.get('price_filter') == 'Price Range' and (filters.get('min_price') or filters.get('max_price')):
-        handles_in_price_range = set()
+    elif price_filter == 'Price Range' and (filters.get('min_price') or filters.get('max_price')):
         min_price = float(filters.get('min_price', 0))
         max_price = float(filters.get('max_price', float('inf')))
-        for handle in product_handles:
-            product_rows = df[df['Handle'] == handle]
-            prices = pd.to_numeric(product_rows['Variant Price'], errors='coerce').dropna()
-            if len(prices) > 0 and (min_price <= prices).any() and (prices <= max_price).any():
-                handles_in_price_range.add(handle)
-        filtered_handles &= handles_in_price_range
+        # NaN prices compare False, so products without any price drop out here
+        in_price_range = (
+            (prices >= min_price).groupby(handles, sort=False, observed=True).any() &
+            (prices <= max_price).groupby(handles, sort=False, observed=True).any()
+        )
+        filtered_handles &= set(in_price_range.index[in_price_range])
     
     # Filter by number of variants
     if filters.get('min_variants') or filters.get('max_variants'):
-        handles_in_variant_range = set()
         min_variants = int(filters.get('min_variants', 0))
         max_variants = int(filters.get('max_variants', float('inf')))
-        for handle in product_handles:
-            product_rows = df[df['Handle'] == handle]
-            variant_count = len(product_rows[product_rows['Variant Price'].notna()])
-            if min_variants <= variant_count <= max_variants:
-                handles_in_variant_range.add(handle)
-        filtered_handles &= handles_in_variant_range
+        variant_counts = df['Variant Price'].notna().groupby(handles, sort=False, observed=True).sum()
+        in_variant_range = variant_counts.between(min_variants, max_variants)
+        filtered_handles &= set(in_variant_range.index[in_variant_range])
 
     # Filter by specific tags
     if filters.get('tags'):
-        handles_with_tags = set()
         tag_list = [tag.strip() for tag in filters['tags'].split(',')]
-        for handle in product_handles:
-            product_rows = df[df['Handle'] == handle]
-            product_tags = str(product_rows['Tags'].iloc[0]) if not pd.isna(product_rows['Tags'].iloc[0]) else ''
-            if any(tag in product_tags for tag in tag_list):
-                handles_with_tags.add(handle)
-        filtered_handles &= handles_with_tags
+        # One escaped alternation matches any tag as a plain substring
+        tag_pattern = re.compile('|'.join(map(re.escape, tag_list)))
+        # Tags are read from the first row of each product
+        first_tags = df.drop_duplicates(subset='Handle').set_index('Handle')['Tags']
+        has_tags = first_tags.fillna('').astype(str).str.contains(tag_pattern)
+        filtered_handles &= set(has_tags.index[has_tags])
     
     # Limit number of products
     if filters.get('product_limit'):
         filtered_handles = set(list(filtered_handles)[:int(filters['product_limit'])])
     
-    return filtered_df[filtered_df['Handle'].isin(filtered_handles)]
+    return df[df['Handle'].isin(filtered_handles)]
 
 def show_filter_sidebar():
     """Display and collect filter options from sidebar."""
@@ -147,15 +141,16 @@ def show_statistics(df):
     col1, col2, col3, col4 = st.columns(4)
     
     # Calculate statistics
+    prices = pd.to_numeric(df['Variant Price'], errors='coerce')
     unique_products = len(df['Handle'].unique())
-    variant_counts = df.groupby('Handle').apply(lambda x: len(x[x['Variant Price'].notna()]))
-    products_with_variants = sum(variant_counts > 1)
-    products_with_images = df.groupby('Handle').apply(lambda x: x['Variant Image'].notna().any()).sum()
+    variant_counts = df['Variant Price'].notna().groupby(df['Handle'], observed=True).sum()
+    products_with_variants = (variant_counts > 1).sum()
+    products_with_images = df['Variant Image'].notna().groupby(df['Handle'], observed=True).any().sum()
     
     # Calculate zero price products
-    zero_price_products = df.groupby('Handle').apply(
-        lambda x: pd.to_numeric(x['Variant Price'], errors='coerce').eq(0).any() or 
-                 pd.to_numeric(x['Variant Price'], errors='coerce').isna().all()
+    zero_price_products = (
+        prices.eq(0).groupby(df['Handle'], observed=True).any()
+        | prices.isna().groupby(df['Handle'], observed=True).all()
     ).sum()
     
     with col1:
@@ -169,28 +164,20 @@ def show_statistics(df):
     
     # Product Breakdown
     st.subheader("Product Breakdown")
-    product_breakdown = []
-    for handle in df['Handle'].unique():
-        product_rows = df[df['Handle'] == handle]
-        variant_rows = len(product_rows[product_rows['Variant Price'].notna()])
-        variant_images = product_rows['Variant Image'].notna().sum()
-        
-        # Safely calculate average price
-        prices = pd.to_numeric(product_rows['Variant Price'], errors='coerce')
-        avg_price = prices.mean() if not prices.empty else 0
-        has_zero_price = prices.eq(0).any() or prices.isna().all()
-        
-        product_breakdown.append({
-            'Handle': handle,
-            'Title': product_rows['Title'].iloc[0] if 'Title' in product_rows else 'N/A',
-            'Variants': variant_rows,
-            'Variant Images': variant_images,
-            'Average Price': avg_price,
-            'Has Zero Price': 'Yes' if has_zero_price else 'No',
-            'Tags': product_rows['Tags'].iloc[0] if 'Tags' in product_rows else '',
-        })
-    
-    breakdown_df = pd.DataFrame(product_breakdown)
+    handles = df['Handle']
+    first_rows = df.groupby('Handle', sort=False, observed=True).head(1).set_index('Handle')
+    has_zero_price = (
+        prices.eq(0).groupby(handles, sort=False, observed=True).any()
+        | prices.isna().groupby(handles, sort=False, observed=True).all()
+    )
+    breakdown_df = pd.DataFrame({
+        'Title': first_rows['Title'] if 'Title' in df else 'N/A',
+        'Variants': df['Variant Price'].notna().groupby(handles, sort=False, observed=True).sum(),
+        'Variant Images': df['Variant Image'].notna().groupby(handles, sort=False, observed=True).sum(),
+        'Average Price': prices.groupby(handles, sort=False, observed=True).mean(),
+        'Has Zero Price': has_zero_price.map({True: 'Yes', False: 'No'}),
+        'Tags': first_rows['Tags'] if 'Tags' in df else '',
+    }).rename_axis('Handle').reset_index()
     st.dataframe(
         breakdown_df,
         column_config={
@@ -208,6 +195,12 @@ def show_statistics(df):
         height=400
     )
 
+def to_csv_bytes(df):
+    """Encode the filtered products for download."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
+
 def main():
     st.title("Shopify Product Filter Tool")
     st.write("Upload your Shopify format CSV file to filter and analyze products.")
@@ -217,7 +210,15 @@ def main():
     if uploaded_file is not None:
         try:
             # Load data
-            df = pd.read_csv(uploaded_file)
+            try:
+                # Arrow's multi-threaded parser is much faster but rejects
+                # quoted fields that span lines, so fall back to the default engine
+                df = pd.read_csv(uploaded_file, engine='pyarrow')
+            except ValueError:
+                uploaded_file.seek(0)
+                df = pd.read_csv(uploaded_file)
+            # The filters group and match on Handle, so store it as categories
+            df['Handle'] = df['Handle'].astype('category')
             st.session_state['original_df'] = df
             
             # Show original data preview
@@ -244,17 +245,19 @@ def main():
             with col1:
                 st.download_button(
                     label="Download Filtered Data",
-                    data=filtered_df.to_csv(index=False),
+                    data=to_csv_bytes(filtered_df),
                     file_name=f'filtered_products_{timestamp}.csv',
                     mime='text/csv'
                 )
             
             # Show filter summary
-            if len(df['Handle'].unique()) != len(filtered_df['Handle'].unique()):
+            original_products = len(df['Handle'].unique())
+            filtered_products = len(filtered_df['Handle'].unique())
+            if original_products != filtered_products:
                 st.info(f"""
                     **Filter Summary:**
-                    - Original Products: {len(df['Handle'].unique())}
-                    - Filtered Products: {len(filtered_df['Handle'].unique())}
+                    - Original Products: {original_products}
+                    - Filtered Products: {filtered_products}
                     - Applied Filters:
                         * Image Filter: {filters['variant_image_filter']}
                         * Price Range: {f"${filters['min_price']} - ${filters['max_price']}" if filters['min_price'] or filters['max_price'] else 'No limit'}
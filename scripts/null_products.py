@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import io
 import numpy as np
 from datetime import datetime
 
@@ -12,73 +13,114 @@ st.set_page_config(
 st.title("Shopify Product Price Analysis")
 st.write("Upload your Shopify products CSV file to analyze variant compare prices.")
 
-def analyze_variant_prices(df):
-    """Analyze variant compare prices in the Shopify products dataframe."""
-    st.subheader("Variant Compare Price Analysis")
-    
-    # Create columns for statistics
-    col1, col2, col3 = st.columns(3)
-    
+@st.cache_data(show_spinner="Analyzing prices...")
+def compute_price_analysis(df):
+    """Collect per-product variant and compare price statistics."""
     # Get total unique products and variants
     total_products = len(df['Handle'].unique())
-    total_variants = len(df[df['Variant Price'].notna()])
+    has_price = df['Variant Price'].notna()
+    total_variants = int(has_price.sum())
+    
+    # Option columns present in the file; Shopify supports up to 3 options
+    option_columns = [
+        (f'Option{i} Name', f'Option{i} Value') for i in range(1, 4)
+        if f'Option{i} Name' in df.columns and f'Option{i} Value' in df.columns
+    ]
+    detail_columns = ['Variant Price', 'Variant Compare At Price'] + [
+        col for option in option_columns for col in option
+    ]
+    
+    # Flag missing or zero compare prices once over the whole column
+    compare_price = df['Variant Compare At Price']
+    missing_compare_price = (
+        compare_price.isna() |
+        (compare_price == '') |
+        (compare_price == 0) |
+        (compare_price.astype(str) == 'nan')
+    )
     
-    # Initialize counters for products
-    products_without_compare_price = set()
-    products_with_missing_some_compare_price = set()
-    total_missing_compare_prices = 0
+    # Per-product variant and missing compare price counts: number the handles in
+    # order of appearance (no handle gets -1) and count flagged rows per code
+    handle_codes, handles = pd.factorize(df['Handle'])
+    has_handle = handle_codes >= 0
+    variant_counts = np.bincount(handle_codes[has_handle & has_price.to_numpy()], minlength=len(handles))
+    variant_ends = np.cumsum(variant_counts)
+    product_stats = pd.DataFrame({
+        'variants': variant_counts,
+        'missing': np.bincount(handle_codes[has_handle & missing_compare_price.to_numpy()], minlength=len(handles)),
+        'start': variant_ends - variant_counts,
+        'stop': variant_ends
+    }, index=handles)
+    product_stats = product_stats[product_stats['variants'] > 0]
+    
+    all_missing = product_stats['missing'] == product_stats['variants']
+    products_without_compare_price = set(product_stats.index[all_missing])
+    products_with_missing_some_compare_price = set(
+        product_stats.index[~all_missing & (product_stats['missing'] > 0)]
+    )
+    
+    # Each product's title comes from its first row
+    first_rows = df.drop_duplicates('Handle')
+    titles = dict(zip(first_rows['Handle'], first_rows['Title']))
+    
+    # Priced rows as plain records, grouped by product in file order; each product
+    # keeps a (start, stop) slice and its detail rows are only built when shown
+    priced_rows = np.flatnonzero(has_handle & has_price.to_numpy())
+    priced_rows = priced_rows[np.argsort(handle_codes[priced_rows], kind='stable')]
+    variant_records = df[detail_columns].iloc[priced_rows].to_dict('records')
     
-    # Analyze each product's variants
     price_analysis = []
-    for handle in df['Handle'].unique():
-        product_variants = df[df['Handle'] == handle]
-        total_product_variants = len(product_variants[product_variants['Variant Price'].notna()])
-        
-        if total_product_variants == 0:
-            continue
-            
-        # Count variants with missing or zero compare price
-        missing_compare_price = product_variants[
-            (product_variants['Variant Compare At Price'].isna()) | 
-            (product_variants['Variant Compare At Price'] == '') |
-            (product_variants['Variant Compare At Price'] == 0) |
-            (product_variants['Variant Compare At Price'].astype(str) == 'nan')
-        ]
-        missing_count = len(missing_compare_price)
-        total_missing_compare_prices += missing_count
-        
-        if missing_count == total_product_variants:
-            products_without_compare_price.add(handle)
-        elif missing_count > 0:
-            products_with_missing_some_compare_price.add(handle)
-            
-        # Get variant information
-        variant_info = []
-        for _, variant in product_variants[product_variants['Variant Price'].notna()].iterrows():
-            variant_details = {
-                'Price': variant.get('Variant Price', 'N/A'),
-                'Compare Price': variant.get('Variant Compare At Price', 'N/A')
-            }
-            
-            # Add options if they exist
-            for i in range(1, 4):  # Shopify supports up to 3 options
-                option_name = f'Option{i} Name'
-                option_value = f'Option{i} Value'
-                if option_name in variant and option_value in variant:
-                    if not pd.isna(variant[option_name]):
-                        variant_details[variant[option_name]] = variant[option_value]
-            
-            variant_info.append(variant_details)
-            
+    for handle, total_product_variants, missing_count, start, stop in zip(
+        product_stats.index, product_stats['variants'].tolist(), product_stats['missing'].tolist(),
+        product_stats['start'].tolist(), product_stats['stop'].tolist()
+    ):
         price_analysis.append({
             'Handle': handle,
-            'Title': product_variants['Title'].iloc[0],
+            'Title': titles[handle],
             'Total Variants': total_product_variants,
             'Variants Missing Compare Price': missing_count,
-            'Percentage Missing': round(missing_count / total_product_variants * 100 if total_product_variants > 0 else 0, 2),
-            'Variant Details': variant_info
+            'Percentage Missing': round(missing_count / total_product_variants * 100, 2),
+            'Variant Rows': (start, stop)
         })
     
+    return (
+        total_products, total_variants, products_without_compare_price,
+        products_with_missing_some_compare_price, price_analysis,
+        variant_records, option_columns
+    )
+
+def get_variant_details(variant_records, variant_rows, option_columns):
+    """Build one product's variant detail rows from its slice of the priced records."""
+    start, stop = variant_rows
+    variant_info = []
+    for variant in variant_records[start:stop]:
+        variant_details = {
+            'Price': variant['Variant Price'],
+            'Compare Price': variant['Variant Compare At Price']
+        }
+        
+        # Add options if they exist
+        for option_name, option_value in option_columns:
+            if not pd.isna(variant[option_name]):
+                variant_details[variant[option_name]] = variant[option_value]
+        
+        variant_info.append(variant_details)
+    return variant_info
+
+def analyze_variant_prices(df):
+    """Analyze variant compare prices in the Shopify products dataframe."""
+    st.subheader("Variant Compare Price Analysis")
+    
+    # Create columns for statistics
+    col1, col2, col3 = st.columns(3)
+    
+    # Reruns from the sort and filter widgets reuse the cached analysis
+    (
+        total_products, total_variants, products_without_compare_price,
+        products_with_missing_some_compare_price, price_analysis,
+        variant_records, option_columns
+    ) = compute_price_analysis(df)
+    
     # Display summary statistics
     with col1:
         st.metric(
@@ -139,14 +181,21 @@ def analyze_variant_prices(df):
     elif show_filter == 'Only Partial Missing Compare Prices':
         filtered_analysis = [p for p in filtered_analysis if 0 < p['Percentage Missing'] < 100]
     
-    # Sort the analysis
-    filtered_analysis.sort(
-        key=lambda x: x[sort_by] if sort_by != 'Handle' else x[sort_by].lower(),
-        reverse=sort_by != 'Handle'
-    )
+    # Sort the analysis on one key array; the stable sort keeps ties in list order
+    if sort_by == 'Handle':
+        sort_keys = np.array([p['Handle'].lower() for p in filtered_analysis], dtype=str)
+        order = np.argsort(sort_keys, kind='stable')
+    else:
+        sort_keys = np.array([p[sort_by] for p in filtered_analysis], dtype=float)
+        order = np.argsort(-sort_keys, kind='stable')
+    filtered_analysis = [filtered_analysis[i] for i in order]
     
-    # Display each product's analysis
-    for product in filtered_analysis:
+    # Display each product's analysis, one page of expanders at most;
+    # the export below still covers every filtered product
+    max_displayed = 500
+    if len(filtered_analysis) > max_displayed:
+        st.write(f"Showing the first {max_displayed} of {len(filtered_analysis)} products.")
+    for product in filtered_analysis[:max_displayed]:
         with st.expander(f"{product['Title']} ({product['Handle']})"):
             col1, col2 = st.columns(2)
             
@@ -157,7 +206,9 @@ def analyze_variant_prices(df):
             
             # Display variant details in a table
             st.write("**Variant Details:**")
-            variant_df = pd.DataFrame(product['Variant Details'])
+            variant_df = pd.DataFrame(
+                get_variant_details(variant_records, product['Variant Rows'], option_columns)
+            )
             st.dataframe(variant_df, height=150)
     
     # Export functionality
@@ -165,7 +216,7 @@ def analyze_variant_prices(df):
         # Create a flattened version of the analysis for export
         export_rows = []
         for product in filtered_analysis:
-            for variant in product['Variant Details']:
+            for variant in get_variant_details(variant_records, product['Variant Rows'], option_columns):
                 row = {
                     'Handle': product['Handle'],
                     'Title': product['Title'],
@@ -183,21 +234,40 @@ def analyze_variant_prices(df):
         
         export_df = pd.DataFrame(export_rows)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        csv = export_df.to_csv(index=False)
         st.download_button(
             label="Download Price Analysis CSV",
-            data=csv,
+            data=to_csv_bytes(export_df),
             file_name=f'price_analysis_{timestamp}.csv',
             mime='text/csv'
         )
 
+def to_csv_bytes(df):
+    """Encode a price report for its download button."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def read_uploaded_csv(file_bytes):
+    """Read the uploaded Shopify CSV once per distinct file content."""
+    # pyarrow can't parse quoted multi-line fields, so fall back to the C parser
+    try:
+        df = pd.read_csv(io.BytesIO(file_bytes), engine='pyarrow')
+    except ValueError:
+        df = pd.read_csv(io.BytesIO(file_bytes))
+    
+    # The price analysis groups every row by Handle; categories make that cheaper
+    if 'Handle' in df.columns:
+        df['Handle'] = df['Handle'].astype('category')
+    return df
+
 def main():
     uploaded_file = st.file_uploader("Choose Shopify CSV file", type=['csv'])
     
     if uploaded_file is not None:
         try:
             st.info("Processing file...")
-            df = pd.read_csv(uploaded_file)
+            df = read_uploaded_csv(uploaded_file.getvalue())
             
             with st.expander("View Input Data Preview", expanded=True):
                 st.dataframe(df, height=400)
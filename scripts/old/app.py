@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
+import io
 import numpy as np
 from datetime import datetime
 import os
-from itertools import product
-import io
+from functools import lru_cache
 
 st.set_page_config(
     page_title="WordPress to Shopify Converter",
@@ -15,32 +15,34 @@ st.set_page_config(
 st.title("WordPress to Shopify Product Converter")
 st.write("Upload your WordPress products CSV file to convert it to Shopify format.")
 
-def parse_images(image_str):
-    if pd.isna(image_str):
-        return []
+def parse_images(image_col):
+    """Parse an images column into a list of url/alt dicts per row index."""
+    entries = image_col.dropna().astype(str).str.split('|').explode().str.strip()
+    entries = entries[entries != '']
     
-    images = []
-    for img in image_str.split('|'):
-        img = img.strip()
-        if not img:
-            continue
-            
-        parts = img.split('!')
-        url = parts[0].strip()
-        alt_text = ''
-        for part in parts[1:]:
-            if part.strip().startswith('alt :'):
-                alt_text = part.replace('alt :', '').strip()
-                break
-                
-        images.append({'url': url, 'alt': alt_text})
+    urls = entries.str.split('!', n=1).str[0].str.strip()
+    # Alt text is the first '!'-separated part starting with 'alt :'
+    alts = (
+        entries.str.extract(r'!\s*alt :([^!]*)', expand=False)
+        .fillna('')
+        .str.replace('alt :', '', regex=False)
+        .str.strip()
+    )
+    
+    images = {idx: [] for idx in image_col.index}
+    for idx, url, alt_text in zip(entries.index, urls, alts):
+        images[idx].append({'url': url, 'alt': alt_text})
     return images
 
 def extract_tags(category_str):
     """Extract tags from the tax:product_cat column."""
     if pd.isna(category_str):
         return ''
-    
+    return extract_category_tags(category_str)
+
+@lru_cache(maxsize=4096)
+def extract_category_tags(category_str):
+    """Join the last level of each category path; cached since parents share categories."""
     tags = []
     # Split by pipe to handle multiple categories
     for category in category_str.split('|'):
@@ -69,35 +71,32 @@ def get_attribute_columns(df):
     
     return sorted(attribute_cols)
 
-def get_option_values(children_df, option_name):
-    col_name = f'meta:attribute_pa_{option_name}'
-    values = []
-    for _, row in children_df.iterrows():
-        if col_name in row and not pd.isna(row[col_name]):
-            vals = [v.strip() for v in str(row[col_name]).split('|') if v.strip()]
-            values.extend(vals)
-    return sorted(list(set(values)))
+def get_option_values(children_df, attribute_cols):
+    """Map each parent ID to its sorted option values per attribute."""
+    option_values = {}
+    children_df = children_df.set_index('post_parent')
+    for attr in attribute_cols:
+        col_name = f'meta:attribute_pa_{attr}'
+        if col_name not in children_df.columns:
+            continue
+        values = children_df[col_name].dropna().astype(str).str.split('|').explode().str.strip()
+        values = values[values != '']
+        for parent_id, unique_values in values.groupby(level=0, sort=False).unique().items():
+            option_values.setdefault(parent_id, {})[attr] = sorted(unique_values)
+    return option_values
 
 def create_base_row(parent_row):
     return {
-        'Handle': parent_row['post_title'],
-        'Title': parent_row['post_title'],
-        'Body (HTML)': parent_row['post_excerpt'] if not pd.isna(parent_row['post_excerpt']) else '',
-        'Published': str(parent_row['post_status'] == 'publish').lower(),
-        'Variant Price': parent_row['regular_price'] if not pd.isna(parent_row['regular_price']) else '',
-        'Variant Compare At Price': parent_row['sale_price'] if not pd.isna(parent_row['sale_price']) else '',
-        'Tags': extract_tags(parent_row.get('tax:product_cat', ''))  # Add tags from product categories
+        'Handle': parent_row.post_title,
+        'Title': parent_row.post_title,
+        'Body (HTML)': parent_row.post_excerpt if not pd.isna(parent_row.post_excerpt) else '',
+        'Published': str(parent_row.post_status == 'publish').lower(),
+        'Variant Price': parent_row.regular_price if not pd.isna(parent_row.regular_price) else '',
+        'Variant Compare At Price': parent_row.sale_price if not pd.isna(parent_row.sale_price) else '',
+        'Tags': extract_tags(getattr(parent_row, 'product_cat', ''))  # Add tags from product categories
     }
 
-def create_variant_rows(parent_row, children_df, attribute_cols):
-    # Get values for all available attributes
-    attribute_values = {}
-    for attr in attribute_cols:
-        values = get_option_values(children_df, attr)
-        if values:
-            attribute_values[attr] = values
-    
-    images = parse_images(parent_row['images'])
+def create_variant_rows(parent_row, attribute_values, images):
     if not images:
         images = [{'url': '', 'alt': ''}]
     
@@ -123,7 +122,7 @@ def create_variant_rows(parent_row, children_df, attribute_cols):
     # Add additional image rows
     for idx, img in enumerate(images[1:], 2):
         img_row = {
-            'Handle': parent_row['post_title'],
+            'Handle': parent_row.post_title,
             'Image Src': img['url'],
             'Image Alt Text': img['alt'],
             'Image Position': idx,
@@ -134,44 +133,54 @@ def create_variant_rows(parent_row, children_df, attribute_cols):
     # Create variant rows
     if attribute_values:
         options = list(attribute_values.values())
-        option_names = [name.capitalize() for name in attribute_values.keys()]
+        option_names = {
+            f'Option{i} Name': name.capitalize() for i, name in enumerate(attribute_values.keys(), 1)
+        }
+        value_keys = [f'Option{i} Value' for i in range(1, len(options) + 1)]
         
-        for combination in product(*options):
-            if combination == tuple([v[0] for v in options]):
-                continue
-                
-            variant_row = base_row.copy()
-            
-            for i, (name, value) in enumerate(zip(option_names, combination), 1):
-                variant_row[f'Option{i} Name'] = name
-                variant_row[f'Option{i} Value'] = value
-                    
-            rows.append(variant_row)
+        # Every combination as flat value columns, in itertools.product order;
+        # the first combination is already on the first row
+        grids = np.meshgrid(*[np.array(values, dtype=object) for values in options], indexing='ij')
+        for combination in zip(*(grid.ravel()[1:] for grid in grids)):
+            rows.append({**base_row, **option_names, **dict(zip(value_keys, combination))})
             
     return rows
 
+@st.cache_data(show_spinner="Converting products...")
 def convert_wordpress_to_shopify(df):
     parent_products = df[pd.isna(df['post_parent'])]
     attribute_cols = get_attribute_columns(df)
     
+    # Collect every parent's option values in one pass over the children
+    option_values = get_option_values(df[df['post_parent'].notna()], attribute_cols)
+    
     output_rows = []
-    progress_bar = st.progress(0)
-    total_products = len(parent_products)
     
-    for idx, (_, parent_row) in enumerate(parent_products.iterrows()):
-        children = df[df['post_parent'] == parent_row['ID']]
-        product_rows = create_variant_rows(parent_row, children, attribute_cols)
+    images_by_parent = parse_images(parent_products['images'])
+    
+    # itertuples needs identifier-safe field names
+    parent_products = parent_products.rename(columns={'tax:product_cat': 'product_cat'})
+    
+    for parent_row in parent_products.itertuples():
+        product_rows = create_variant_rows(
+            parent_row, option_values.get(parent_row.ID, {}), images_by_parent[parent_row.Index]
+        )
         output_rows.extend(product_rows)
-        
-        # Update progress bar
-        progress = (idx + 1) / total_products
-        progress_bar.progress(progress)
     
-    output_df = pd.DataFrame(output_rows)
-    progress_bar.empty()
+    # Build column lists up front rather than letting pandas union every row's keys
+    column_names = dict.fromkeys(key for row in output_rows for key in row)
+    output_df = pd.DataFrame({
+        name: [row.get(name, np.nan) for row in output_rows] for name in column_names
+    })
     
     return output_df
 
+def to_csv_bytes(df):
+    """Encode the converted Shopify rows for download."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
+
 def main():
     uploaded_file = st.file_uploader("Choose WordPress CSV file", type=['csv'])
     
@@ -208,22 +217,16 @@ def main():
                 
                 # Show detailed product breakdown in expander
                 with st.expander("View Detailed Product Breakdown", expanded=True):
-                    product_breakdown = []
-                    for handle in output_df['Handle'].unique():
-                        product_rows = output_df[output_df['Handle'] == handle]
-                        variant_rows = product_rows[product_rows['Variant Price'].notna()].shape[0]
-                        image_rows = product_rows[product_rows['Image Position'].notna()].shape[0]
-                        
-                        product_breakdown.append({
-                            'Handle': handle,
-                            'Title': product_rows['Title'].iloc[0] if 'Title' in product_rows else 'N/A',
-                            'Variants': variant_rows,
-                            'Images': image_rows,
-                            'Total Rows': len(product_rows),
-                            'Tags': product_rows['Tags'].iloc[0] if 'Tags' in product_rows else ''
-                        })
+                    handles = output_df['Handle']
+                    first_rows = output_df.groupby('Handle', sort=False).head(1).set_index('Handle')
+                    breakdown_df = pd.DataFrame({
+                        'Title': first_rows['Title'] if 'Title' in output_df else 'N/A',
+                        'Variants': output_df['Variant Price'].notna().groupby(handles, sort=False).sum(),
+                        'Images': output_df['Image Position'].notna().groupby(handles, sort=False).sum(),
+                        'Total Rows': handles.groupby(handles, sort=False).size(),
+                        'Tags': first_rows['Tags'] if 'Tags' in output_df else '',
+                    }).rename_axis('Handle').reset_index()
                     
-                    breakdown_df = pd.DataFrame(product_breakdown)
                     st.dataframe(
                         breakdown_df,
                         column_config={
@@ -245,10 +248,9 @@ def main():
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 output_filename = f'wordpress-to-shopify_{timestamp}.csv'
                 
-                csv = output_df.to_csv(index=False)
                 st.download_button(
                     label="Download Converted CSV",
-                    data=csv,
+                    data=to_csv_bytes(output_df),
                     file_name=output_filename,
                     mime='text/csv'
                 )
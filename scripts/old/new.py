@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
+import io
 import numpy as np
 from datetime import datetime
 from itertools import product
-import io
 
 st.set_page_config(
     page_title="WordPress to Shopify Converter",
@@ -14,26 +14,23 @@ st.set_page_config(
 st.title("WordPress to Shopify Product Converter")
 st.write("Upload your WordPress products CSV file to convert it to Shopify format.")
 
-def parse_images(image_str):
-    """Parse image string into list of dictionaries containing URL and alt text."""
-    if pd.isna(image_str):
-        return []
+def parse_images(image_col):
+    """Parse an images column into lists of URL/alt dicts keyed by row index."""
+    entries = image_col.dropna().astype(str).str.split('|').explode().str.strip()
+    entries = entries[entries != '']
     
-    images = []
-    for img in image_str.split('|'):
-        img = img.strip()
-        if not img:
-            continue
-            
-        parts = img.split('!')
-        url = parts[0].strip()
-        alt_text = ''
-        for part in parts[1:]:
-            if part.strip().startswith('alt :'):
-                alt_text = part.replace('alt :', '').strip()
-                break
-                
-        images.append({'url': url, 'alt': alt_text})
+    urls = entries.str.split('!', n=1).str[0].str.strip()
+    # The alt part is the one marked 'alt :'
+    alts = (
+        entries.str.extract(r'!\s*alt :([^!]*)', expand=False)
+        .fillna('')
+        .str.replace('alt :', '', regex=False)
+        .str.strip()
+    )
+    
+    images = {idx: [] for idx in image_col.dropna().index}
+    for idx, url, alt_text in zip(entries.index, urls, alts):
+        images[idx].append({'url': url, 'alt': alt_text})
     return images
 
 def extract_tags(category_str, single_tag_mode=False):
@@ -59,32 +56,35 @@ def extract_tags(category_str, single_tag_mode=False):
     
     return sorted(set(tags))
 
+def split_attribute_values(values):
+    """Split an attribute column into one option value per row."""
+    values = values.dropna()
+    if pd.api.types.is_numeric_dtype(values):
+        # Convert float to int to string to remove decimals
+        return values.astype(int).astype(str)
+    
+    # Handle string values that might have delimiters
+    values = values.astype(str).str.split('|').explode().str.strip()
+    return values[values != '']
+
 def get_all_attribute_values(df, attribute_name):
     """Get all unique values for a given attribute across parent and child products."""
-    values = set()
-    
     # Check only meta:attribute_pa_ columns
     meta_col = f'meta:attribute_pa_{attribute_name}'
-    if meta_col in df.columns:
-        # Get values from both parent and child rows
-        all_values = df[meta_col].dropna()
-        for val in all_values:
-            # Handle both string and numeric values
-            try:
-                if isinstance(val, (int, float)):
-                    # Handle numeric values
-                    values.add(str(int(val))) # Convert float to int to string to remove decimals
-                else:
-                    # Handle string values that might have delimiters
-                    for v in str(val).split('|'):
-                        if v.strip():
-                            values.add(v.strip())
-            except:
-                # If any conversion fails, just add the original value
-                if val:
-                    values.add(str(val))
-    
-    return sorted(list(values))
+    if meta_col not in df.columns:
+        return []
+    return sorted(set(split_attribute_values(df[meta_col])))
+
+def get_product_attribute_values(df, valid_attrs):
+    """Get each product's attribute values from its parent and child rows."""
+    # Parents belong to their own product, children to their parent's
+    product_ids = df['post_parent'].fillna(df['ID'])
+    attribute_values = {}
+    for attr in valid_attrs:
+        values = split_attribute_values(df[f'meta:attribute_pa_{attr}'].set_axis(product_ids))
+        for product_id, unique_values in values.groupby(level=0, sort=False).unique().items():
+            attribute_values.setdefault(product_id, {})[attr] = sorted(unique_values)
+    return attribute_values
 
 def get_valid_attributes(df):
     """Get attributes that have values, excluding brand."""
@@ -100,19 +100,16 @@ def get_valid_attributes(df):
     
     return sorted(valid_attrs)
 
-def get_variant_image(variant_row, parent_images, attribute_values):
+def get_variant_image(variant_images, parent_urls, image_positions, attribute_values):
     """Get the appropriate image URL for a variant."""
-    if not pd.isna(variant_row['images']):
+    if variant_images is not None:
         # If variant has its own image, use it
-        variant_images = parse_images(variant_row['images'])
         return variant_images[0]['url'] if variant_images else ''
     
-    # If variant has no image, find matching parent image based on attributes
-    for img in parent_images:
-        img_url = img['url'].lower()
-        for attr_val in attribute_values:
-            if attr_val.lower() in img_url:
-                return img['url']
+    # If variant has no image, take the first parent image matching any of its attributes
+    positions = [image_positions[attr_val] for attr_val in attribute_values if attr_val in image_positions]
+    if positions:
+        return parent_urls[min(positions)][0]
     
     # If no match found, return empty string
     return ''
@@ -127,7 +124,26 @@ def get_brand_from_children(children_df, parent_row):
             return brand_values.iloc[0]
     return ''
 
-def create_variant_rows(parent_row, children_df, valid_attrs, single_tag=None):
+def index_children_by_attributes(children_df, attr_names):
+    """Index each child by the option value tuples it can match, first child winning."""
+    child_lookup = {}
+    child_attr_rows = children_df[
+        [f'meta:attribute_pa_{attr_name}' for attr_name in attr_names]
+    ].to_numpy(dtype=object)
+    for child_pos, child_attrs in enumerate(child_attr_rows):
+        child_options = []
+        for child_attr in child_attrs:
+            if pd.isna(child_attr):
+                # An empty attribute matches any value, keyed as None
+                child_options.append([None])
+            else:
+                child_value = str(child_attr)
+                child_options.append([v.strip() for v in child_value.split('|')] if '|' in child_value else [child_value])
+        for key in product(*child_options):
+            child_lookup.setdefault(key, child_pos)
+    return child_lookup
+
+def create_variant_rows(parent_row, children_df, attribute_values, parent_images, images_by_row, single_tag=None):
     """Create variant rows with comprehensive attribute processing."""
     # Base setup
     brand_value = get_brand_from_children(children_df, parent_row)
@@ -140,28 +156,20 @@ def create_variant_rows(parent_row, children_df, valid_attrs, single_tag=None):
         'Brand (product.metafields.custom.brand)': brand_value
     }
     
-    parent_images = parse_images(parent_row['images'])
     rows = []
     
-    # Collect all attribute values comprehensively
-    attribute_values = {}
-    for attr in valid_attrs:
-        values = set()
-        
-        # Get values from parent
-        parent_values = get_all_attribute_values(pd.DataFrame([parent_row]), attr)
-        values.update(parent_values)
-        
-        # Get values from children
-        if not children_df.empty:
-            child_values = get_all_attribute_values(children_df, attr)
-            values.update(child_values)
-            
-        if values:
-            attribute_values[attr] = sorted(list(values))
-    
     # Create first row with parent data
     first_row = base_row.copy()
+    parent_urls = [(img['url'], img['url'].lower()) for img in parent_images]
+    image_positions = {}
+    for values in attribute_values.values():
+        for value in values:
+            value_lower = value.lower()
+            for pos, (_, url_lower) in enumerate(parent_urls):
+                if value_lower in url_lower:
+                    image_positions[value] = pos
+                    break
+    
     if parent_images:
         first_row['Image Src'] = parent_images[0]['url']
         first_row['Image Alt Text'] = parent_images[0]['alt']
@@ -173,7 +181,7 @@ def create_variant_rows(parent_row, children_df, valid_attrs, single_tag=None):
         first_row['Variant Price'] = first_variant['regular_price'] if not pd.isna(first_variant['regular_price']) else ''
         first_row['Variant Compare At Price'] = first_variant['sale_price'] if not pd.isna(first_variant['sale_price']) else ''
         
-        variant_image = get_variant_image(first_variant, parent_images, [])
+        variant_image = get_variant_image(images_by_row.get(first_variant.name), parent_urls, image_positions, [])
         if variant_image:
             first_row['Variant Image'] = variant_image
         
@@ -206,34 +214,27 @@ def create_variant_rows(parent_row, children_df, valid_attrs, single_tag=None):
         attr_names = list(attribute_values.keys())
         attr_values = [attribute_values[name] for name in attr_names]
         
-        for variant_values in product(*attr_values):
-            # Skip first combination as it's already handled
-            if variant_values == tuple(v[0] for v in attr_values):
-                continue
-                
+        child_lookup = index_children_by_attributes(children_df, attr_names)
+        
+        # Every option combination in one meshgrid, minus the first, which the
+        # parent row already carries
+        grids = np.meshgrid(*[np.array(values, dtype=object) for values in attr_values], indexing='ij')
+        for variant_values in zip(*(grid.ravel()[1:] for grid in grids)):
             variant_row = base_row.copy()
             
             # Find matching child row
-            matching_child = None
-            for _, child in children_df.iterrows():
-                matches = True
-                for attr_name, value in zip(attr_names, variant_values):
-                    col_name = f'meta:attribute_pa_{attr_name}'
-                    if col_name in child and not pd.isna(child[col_name]):
-                        child_value = str(child[col_name])
-                        child_values = [v.strip() for v in child_value.split('|')] if '|' in child_value else [child_value]
-                        if str(value) not in child_values:
-                            matches = False
-                            break
-                if matches:
-                    matching_child = child
-                    break
+            candidates = [
+                child_lookup[key]
+                for key in product(*[(str(value), None) for value in variant_values])
+                if key in child_lookup
+            ]
+            matching_child = children_df.iloc[min(candidates)] if candidates else None
             
             # Add variant-specific data
             if matching_child is not None:
                 variant_row['Variant Price'] = matching_child['regular_price'] if not pd.isna(matching_child['regular_price']) else ''
                 variant_row['Variant Compare At Price'] = matching_child['sale_price'] if not pd.isna(matching_child['sale_price']) else ''
-                variant_image = get_variant_image(matching_child, parent_images, variant_values)
+                variant_image = get_variant_image(images_by_row.get(matching_child.name), parent_urls, image_positions, variant_values)
                 if variant_image:
                     variant_row['Variant Image'] = variant_image
             
@@ -246,46 +247,65 @@ def create_variant_rows(parent_row, children_df, valid_attrs, single_tag=None):
     
     return rows
 
+@st.cache_data(show_spinner="Converting products...")
 def convert_wordpress_to_shopify(df, single_tag_mode=False):
     """Main conversion function."""
     parent_products = df[pd.isna(df['post_parent'])]
     valid_attrs = get_valid_attributes(df)  # This now excludes brand
+    # Keep only the columns variant rows read, so per-parent child frames stay narrow
+    child_cols = ['post_parent', 'regular_price', 'sale_price'] + [
+        f'meta:attribute_pa_{attr}' for attr in valid_attrs
+    ]
+    if 'meta:attribute_pa_brand' in df.columns:
+        child_cols.append('meta:attribute_pa_brand')
+    children_df = df.loc[df['post_parent'].notna(), child_cols]
+    children_by_parent = {
+        parent_id: children
+        for parent_id, children in children_df.groupby('post_parent', sort=False)
+    }
+    no_children = children_df.iloc[0:0]
+    attribute_values = get_product_attribute_values(df, valid_attrs)
+    images_by_row = parse_images(df['images'])
     
     output_rows = []
-    progress_bar = st.progress(0)
+    
+    parent_records = parent_products.to_dict('index')
     
     if single_tag_mode:
         # Process one product per tag
-        all_tags = set()
-        for _, row in parent_products.iterrows():
-            if not pd.isna(row.get('tax:product_cat')):
-                tags = [t.strip() for t in row['tax:product_cat'].split('|')]
-                all_tags.update(tags)
+        categories = parent_products['tax:product_cat'].dropna().astype(str)
+        # Parents share a handful of category strings; keeping each one's first
+        # row preserves which parent is found first for a tag
+        unique_categories = categories.drop_duplicates()
+        all_tags = set(unique_categories.str.split('|').explode().str.strip())
         
-        total_tags = len(all_tags)
-        for idx, tag in enumerate(sorted(all_tags)):
-            for _, parent_row in parent_products.iterrows():
-                if not pd.isna(parent_row.get('tax:product_cat')) and tag in parent_row['tax:product_cat']:
-                    children = df[df['post_parent'] == parent_row['ID']]
-                    product_rows = create_variant_rows(parent_row, children, valid_attrs, tag)
-                    output_rows.extend(product_rows)
-                    break
-            
-            progress = (idx + 1) / total_tags
-            progress_bar.progress(progress)
+        for tag in sorted(all_tags):
+            # Tags match as substrings of the raw category string, so one C-level
+            # contains pass over the distinct categories finds the first parent for each tag
+            row_idx = unique_categories.str.contains(tag, regex=False).idxmax()
+            parent_row = parent_records[row_idx]
+            children = children_by_parent.get(parent_row['ID'], no_children)
+            product_rows = create_variant_rows(
+                parent_row, children, attribute_values.get(parent_row['ID'], {}),
+                images_by_row.get(row_idx, []), images_by_row, tag
+            )
+            output_rows.extend(product_rows)
     else:
         # Process all products
-        total_products = len(parent_products)
-        for idx, (_, parent_row) in enumerate(parent_products.iterrows()):
-            children = df[df['post_parent'] == parent_row['ID']]
-            product_rows = create_variant_rows(parent_row, children, valid_attrs)
+        for row_idx, parent_row in parent_records.items():
+            children = children_by_parent.get(parent_row['ID'], no_children)
+            product_rows = create_variant_rows(
+                parent_row, children, attribute_values.get(parent_row['ID'], {}),
+                images_by_row.get(row_idx, []), images_by_row
+            )
             output_rows.extend(product_rows)
-            
-            progress = (idx + 1) / total_products
-            progress_bar.progress(progress)
     
-    output_df = pd.DataFrame(output_rows)
-    progress_bar.empty()
+    # Build the frame column by column; rows without a field get NaN
+    columns = dict.fromkeys(key for row in output_rows for key in row)
+    output_df = pd.DataFrame({
+        column: [row.get(column, np.nan) for row in output_rows]
+        for column in columns
+    })
     
     return output_df
 
@@ -302,23 +322,16 @@ def show_statistics(output_df, container):
             st.metric("Total Unique Products", unique_products)
         
         with st.expander("View Detailed Product Breakdown", expanded=True):
-            product_breakdown = []
-            for handle in output_df['Handle'].unique():
-                product_rows = output_df[output_df['Handle'] == handle]
-                variant_rows = product_rows[product_rows['Variant Price'].notna()].shape[0]
-                image_rows = product_rows[product_rows['Image Position'].notna()].shape[0]
-                
-                product_breakdown.append({
-                    'Handle': handle,
-                    'Title': product_rows['Title'].iloc[0] if 'Title' in product_rows else 'N/A',
-                    'Variants': variant_rows,
-                    'Images': image_rows,
-                    'Total Rows': len(product_rows),
-                    'Tags': product_rows['Tags'].iloc[0] if 'Tags' in product_rows else '',
-                    'Brand': product_rows['Brand (product.metafields.custom.brand)'].iloc[0] if 'Brand (product.metafields.custom.brand)' in product_rows else ''
-                })
-            
-            breakdown_df = pd.DataFrame(product_breakdown)
+            handles = output_df['Handle']
+            first_rows = output_df.groupby('Handle', sort=False).head(1).set_index('Handle')
+            breakdown_df = pd.DataFrame({
+                'Title': first_rows['Title'] if 'Title' in output_df else 'N/A',
+                'Variants': output_df['Variant Price'].notna().groupby(handles, sort=False).sum(),
+                'Images': output_df['Image Position'].notna().groupby(handles, sort=False).sum(),
+                'Total Rows': handles.groupby(handles, sort=False).size(),
+                'Tags': first_rows['Tags'] if 'Tags' in output_df else '',
+                'Brand': first_rows['Brand (product.metafields.custom.brand)'] if 'Brand (product.metafields.custom.brand)' in output_df else ''
+            }).rename_axis('Handle').reset_index()
             st.dataframe(
                 breakdown_df,
                 column_config={
@@ -337,21 +350,31 @@ def create_download_button(output_df, prefix):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     output_filename = f'{prefix}_{timestamp}.csv'
     
-    csv = output_df.to_csv(index=False)
     st.download_button(
         label=f"Download {prefix}",
-        data=csv,
+        data=to_csv_bytes(output_df),
         file_name=output_filename,
         mime='text/csv'
     )
 
+def to_csv_bytes(df):
+    """Encode the Shopify output for create_download_button."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def read_uploaded_csv(file_bytes):
+    """Read an uploaded CSV once per distinct file content."""
+    return pd.read_csv(io.BytesIO(file_bytes))
+
 def main():
     uploaded_file = st.file_uploader("Choose WordPress CSV file", type=['csv'])
     
     if uploaded_file is not None:
         try:
             st.info("Processing uploaded file...")
-            df = pd.read_csv(uploaded_file)
+            df = read_uploaded_csv(uploaded_file.getvalue())
             
             with st.expander("View Input Data Preview", expanded=True):
                 st.dataframe(df, height=400)
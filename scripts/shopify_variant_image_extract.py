@@ -1,53 +1,56 @@
 import streamlit as st
 import pandas as pd
+import io
 from datetime import datetime
 import numpy as np
 
 def load_and_analyze_csv(file):
     """Load the CSV and analyze variant images."""
-    df = pd.read_csv(file)
+    try:
+        # pyarrow can't parse multi-line quoted fields; the C parser can
+        df = pd.read_csv(file, engine='pyarrow')
+    except ValueError:
+        file.seek(0)
+        df = pd.read_csv(file)
     
-    # Group by Handle to analyze products
-    products_with_variants = {}
-    current_handle = None
-    current_product = None
+    # Products are runs of consecutive rows sharing a Handle
+    handles = df['Handle'].to_numpy()
+    run_starts = np.flatnonzero(df['Handle'].ne(df['Handle'].shift()).to_numpy())
+    run_stops = np.append(run_starts[1:], len(df))
+    run_ids = np.repeat(np.arange(len(run_starts)), run_stops - run_starts)
     
-    for idx, row in df.iterrows():
-        handle = row['Handle']
-        
-        # Check if this is a new product
-        if handle != current_handle:
-            # Save previous product if it exists
-            if current_product is not None:
-                products_with_variants[current_handle] = current_product
-            
-            # Start new product
-            current_handle = handle
-            current_product = {
-                'title': row.get('Title', ''),
-                'variants_with_images': 0,
-                'total_variants': 0,
-                'rows': [],
-                'has_variant_images': False
-            }
-        
-        # Add row to current product
-        current_product['rows'].append(row)
-        
-        # Check if this row is a variant (has Option1 Name)
-        if 'Option1 Name' in row and not pd.isna(row['Option1 Name']):
-            current_product['total_variants'] += 1
-            
-            # Check if variant has an image
-            if 'Variant Image' in row and not pd.isna(row['Variant Image']):
-                current_product['variants_with_images'] += 1
-                current_product['has_variant_images'] = True
+    # A variant row has Option1 Name; count those and the ones with a Variant Image per run
+    if 'Option1 Name' in df.columns:
+        is_variant = df['Option1 Name'].notna().to_numpy()
+    else:
+        is_variant = np.zeros(len(df), dtype=bool)
+    if 'Variant Image' in df.columns:
+        has_image = is_variant & df['Variant Image'].notna().to_numpy()
+    else:
+        has_image = np.zeros(len(df), dtype=bool)
+    total_variants = np.bincount(run_ids[is_variant], minlength=len(run_starts))
+    variants_with_images = np.bincount(run_ids[has_image], minlength=len(run_starts))
+    
+    if 'Title' in df.columns:
+        titles = df['Title'].to_numpy()[run_starts].tolist()
+    else:
+        titles = [''] * len(run_starts)
     
-    # Save last product
-    if current_product is not None:
-        products_with_variants[current_handle] = current_product
+    # A handle that reappears later keeps its first position but takes the later run's data
+    products_with_variants = {}
+    for handle, title, total, with_images, start, stop in zip(
+        handles[run_starts].tolist(), titles, total_variants.tolist(),
+        variants_with_images.tolist(), run_starts.tolist(), run_stops.tolist()
+    ):
+        products_with_variants[handle] = {
+            'title': title,
+            'variants_with_images': with_images,
+            'total_variants': total,
+            'rows': range(start, stop),
+            'has_variant_images': with_images > 0
+        }
     
-    return products_with_variants
+    return df, products_with_variants
 
 def create_product_summary(products_data):
     """Create a summary DataFrame of products."""
@@ -64,15 +67,24 @@ def create_product_summary(products_data):
     
     return pd.DataFrame(summary_data)
 
-def extract_products_with_variant_images(products_data):
+def extract_products_with_variant_images(df, products_data):
     """Create a DataFrame containing only products with variant images."""
-    rows = []
+    positions = []
     
     for handle, data in products_data.items():
         if data['has_variant_images']:
-            rows.extend(data['rows'])
+            positions.extend(data['rows'])
     
-    return pd.DataFrame(rows)
+    if not positions:
+        return pd.DataFrame()
+    
+    return df.iloc[positions]
+
+def to_csv_bytes(df):
+    """Encode the variant image report for download."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
 
 def main():
     st.set_page_config(page_title="Variant Image Analyzer", layout="wide")
@@ -82,7 +94,7 @@ def main():
     
     if uploaded_file is not None:
         # Load and analyze the data
-        products_data = load_and_analyze_csv(uploaded_file)
+        df, products_data = load_and_analyze_csv(uploaded_file)
         
         # Create summary
         summary_df = create_product_summary(products_data)
@@ -133,17 +145,16 @@ def main():
         # Export options
         st.subheader("Export Options")
         if st.button("Export Products with Variant Images"):
-            products_df = extract_products_with_variant_images(products_data)
+            products_df = extract_products_with_variant_images(df, products_data)
             
             # Generate timestamp for filename
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f'products_with_variant_images_{timestamp}.csv'
             
             # Create download button
-            csv = products_df.to_csv(index=False)
             st.download_button(
                 label="Download CSV",
-                data=csv,
+                data=to_csv_bytes(products_df),
                 file_name=filename,
                 mime='text/csv'
             )
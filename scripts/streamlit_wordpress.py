@@ -1,10 +1,9 @@
 import streamlit as st
 import pandas as pd
+import io
 import numpy as np
 from datetime import datetime
 import os
-from itertools import product
-import io
 
 st.set_page_config(
     page_title="WordPress to Shopify Converter",
@@ -37,13 +36,16 @@ def parse_images(image_str):
     return images
 
 def get_option_values(children_df, option_name):
+    """Map each parent ID to its option values for one attribute, in one pass over the children."""
     col_name = f'meta:attribute_pa_{option_name}'
-    values = []
-    for _, row in children_df.iterrows():
-        if col_name in row and not pd.isna(row[col_name]):
-            vals = [v.strip() for v in str(row[col_name]).split('|') if v.strip()]
-            values.extend(vals)
-    return sorted(list(set(values)))
+    if col_name not in children_df.columns:
+        return {}
+    values = children_df.set_index('post_parent')[col_name].dropna().astype(str).str.split('|').explode().str.strip()
+    values = values[values != '']
+    return {
+        parent_id: sorted(list(set(group)))
+        for parent_id, group in values.groupby(level=0, sort=False)
+    }
 
 def create_base_row(parent_row):
     return {
@@ -55,10 +57,10 @@ def create_base_row(parent_row):
         'Variant Compare At Price': parent_row['sale_price'] if not pd.isna(parent_row['sale_price']) else ''
     }
 
-def create_variant_rows(parent_row, children_df):
-    size_values = get_option_values(children_df, 'sizes')
-    texture_values = get_option_values(children_df, 'texture')
-    thickness_values = get_option_values(children_df, 'thickness')
+def create_variant_rows(parent_row, option_values):
+    size_values = option_values['sizes'].get(parent_row['ID'], [])
+    texture_values = option_values['texture'].get(parent_row['ID'], [])
+    thickness_values = option_values['thickness'].get(parent_row['ID'], [])
     
     images = parse_images(parent_row['images'])
     if not images:
@@ -113,10 +115,10 @@ def create_variant_rows(parent_row, children_df):
             options.append(thickness_values)
             option_names.append('Thickness')
             
-        for combination in product(*options):
-            if combination == tuple([v[0] for v in options]):
-                continue
-                
+        # Every combination in itertools.product order; values are unique per option,
+        # so dropping position 0 skips the first combination already on the first row
+        grids = np.meshgrid(*[np.array(values, dtype=object) for values in options], indexing='ij')
+        for combination in zip(*(grid.ravel()[1:] for grid in grids)):
             variant_row = base_row.copy()
             
             for i, (name, value) in enumerate(zip(option_names, combination), 1):
@@ -127,34 +129,48 @@ def create_variant_rows(parent_row, children_df):
             
     return rows
 
+@st.cache_data(show_spinner="Converting products...")
 def convert_wordpress_to_shopify(df):
     parent_products = df[pd.isna(df['post_parent'])]
     
+    # Collect every parent's option values once instead of rescanning its children
+    children_df = df[df['post_parent'].notna()]
+    option_values = {
+        option_name: get_option_values(children_df, option_name)
+        for option_name in ('sizes', 'texture', 'thickness')
+    }
+    
     output_rows = []
-    progress_bar = st.progress(0)
-    total_products = len(parent_products)
     
-    for idx, (_, parent_row) in enumerate(parent_products.iterrows()):
-        children = df[df['post_parent'] == parent_row['ID']]
-        product_rows = create_variant_rows(parent_row, children)
+    for parent_row in parent_products.to_dict('records'):
+        product_rows = create_variant_rows(parent_row, option_values)
         output_rows.extend(product_rows)
-        
-        # Update progress bar
-        progress = (idx + 1) / total_products
-        progress_bar.progress(progress)
     
-    output_df = pd.DataFrame(output_rows)
-    progress_bar.empty()
+    column_names = dict.fromkeys(key for row in output_rows for key in row)
+    output_df = pd.DataFrame({
+        name: [row.get(name, np.nan) for row in output_rows] for name in column_names
+    })
     
     return output_df
 
+def to_csv_bytes(df):
+    """Encode the converted products as CSV bytes."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def read_uploaded_csv(file_bytes):
+    """Read an uploaded CSV once per distinct file content."""
+    return pd.read_csv(io.BytesIO(file_bytes))
+
 def main():
     uploaded_file = st.file_uploader("Choose WordPress CSV file", type=['csv'])
     
     if uploaded_file is not None:
         try:
             st.info("Processing uploaded file...")
-            df = pd.read_csv(uploaded_file)
+            df = read_uploaded_csv(uploaded_file.getvalue())
             
             # Show input data preview
             st.subheader("Input Data Preview")
@@ -182,22 +198,15 @@ def main():
                 # Show output preview
                 # Add detailed product breakdown
                 with st.expander("View Detailed Product Breakdown"):
-                    # Get counts of variants and images per product
-                    product_breakdown = []
-                    for handle in output_df['Handle'].unique():
-                        product_rows = output_df[output_df['Handle'] == handle]
-                        variant_rows = product_rows[product_rows['Variant Price'].notna()].shape[0]
-                        image_rows = product_rows[product_rows['Image Position'].notna()].shape[0]
-                        
-                        product_breakdown.append({
-                            'Handle': handle,
-                            'Title': product_rows['Title'].iloc[0] if 'Title' in product_rows else 'N/A',
-                            'Variants': variant_rows,
-                            'Images': image_rows,
-                            'Total Rows': len(product_rows)
-                        })
-                    
-                    breakdown_df = pd.DataFrame(product_breakdown)
+                    # Get counts of variants and images per product in one grouped pass per column
+                    handles = output_df['Handle']
+                    first_rows = output_df.groupby('Handle', sort=False).head(1).set_index('Handle')
+                    breakdown_df = pd.DataFrame({
+                        'Title': first_rows['Title'] if 'Title' in output_df else 'N/A',
+                        'Variants': output_df['Variant Price'].notna().groupby(handles, sort=False).sum(),
+                        'Images': output_df['Image Position'].notna().groupby(handles, sort=False).sum(),
+                        'Total Rows': handles.groupby(handles, sort=False).size()
+                    }).rename_axis('Handle').reset_index()
                     st.dataframe(
                         breakdown_df,
                         column_config={
@@ -218,10 +227,9 @@ def main():
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 output_filename = f'wordpress-to-shopify_{timestamp}.csv'
                 
-                csv = output_df.to_csv(index=False)
                 st.download_button(
                     label="Download Converted CSV",
-                    data=csv,
+                    data=to_csv_bytes(output_df),
                     file_name=output_filename,
                     mime='text/csv'
                 )
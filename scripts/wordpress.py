@@ -2,7 +2,6 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import os
-from itertools import product
 
 def parse_images(image_str):
     if pd.isna(image_str):
@@ -26,13 +25,16 @@ def parse_images(image_str):
     return images
 
 def get_option_values(children_df, option_name):
+    """Map each parent ID to its option values for one attribute, in one pass over the children."""
     col_name = f'meta:attribute_pa_{option_name}'
-    values = []
-    for _, row in children_df.iterrows():
-        if col_name in row and not pd.isna(row[col_name]):
-            vals = [v.strip() for v in str(row[col_name]).split('|') if v.strip()]
-            values.extend(vals)
-    return list(set(values))
+    if col_name not in children_df.columns:
+        return {}
+    values = children_df.set_index('post_parent')[col_name].dropna().astype(str).str.split('|').explode().str.strip()
+    values = values[values != '']
+    return {
+        parent_id: list(set(group))
+        for parent_id, group in values.groupby(level=0, sort=False)
+    }
 
 def create_base_row(parent_row):
     return {
@@ -44,11 +46,11 @@ def create_base_row(parent_row):
         'Variant Compare At Price': parent_row['sale_price'] if not pd.isna(parent_row['sale_price']) else ''
     }
 
-def create_variant_rows(parent_row, children_df):
+def create_variant_rows(parent_row, option_values):
     # Get all option values from children
-    size_values = get_option_values(children_df, 'sizes')
-    texture_values = get_option_values(children_df, 'texture')
-    thickness_values = get_option_values(children_df, 'thickness')
+    size_values = option_values['sizes'].get(parent_row['ID'], [])
+    texture_values = option_values['texture'].get(parent_row['ID'], [])
+    thickness_values = option_values['thickness'].get(parent_row['ID'], [])
     
     # Parse images
     images = parse_images(parent_row['images'])
@@ -98,10 +100,9 @@ def create_variant_rows(parent_row, children_df):
         if thickness_values:
             options.append(thickness_values)
             
-        for combination in product(*options):
-            if combination == tuple([v[0] for v in options]):
-                continue  # Skip first combination as it's in the first row
-                
+        # The first combination is already on the parent row, so the grid skips it
+        grids = np.meshgrid(*[np.array(values, dtype=object) for values in options], indexing='ij')
+        for combination in zip(*(grid.ravel()[1:] for grid in grids)):
             variant_row = base_row.copy()
             for i, value in enumerate(combination):
                 option_num = i + 1
@@ -126,17 +127,24 @@ def convert_wordpress_to_shopify():
     # Get parent products (where post_parent is empty/NA)
     parent_products = df[pd.isna(df['post_parent'])]
     
+    # Option values per parent, gathered from the children in one pass
+    children_df = df[df['post_parent'].notna()]
+    option_values = {
+        option_name: get_option_values(children_df, option_name)
+        for option_name in ('sizes', 'texture', 'thickness')
+    }
+    
     output_rows = []
-    for _, parent_row in parent_products.iterrows():
-        # Get children products for this parent
-        children = df[df['post_parent'] == parent_row['ID']]
-        
+    for parent_row in parent_products.to_dict('records'):
         # Create variant rows including images
-        product_rows = create_variant_rows(parent_row, children)
+        product_rows = create_variant_rows(parent_row, option_values)
         output_rows.extend(product_rows)
     
-    # Convert to DataFrame
-    output_df = pd.DataFrame(output_rows)
+    # Convert to DataFrame, building column lists up front rather than letting pandas union every row's keys
+    column_names = dict.fromkeys(key for row in output_rows for key in row)
+    output_df = pd.DataFrame({
+        name: [row.get(name, np.nan) for row in output_rows] for name in column_names
+    })
     
     # Create output folder if it doesn't exist
     if not os.path.exists('output'):
@@ -1,5 +1,6 @@
 import json
 import os
+from collections import defaultdict
 from pathlib import Path
 
 def process_json_files(json_file_paths: list[str], output_dir: str = "output") -> None:
@@ -23,15 +24,25 @@ def process_json_files(json_file_paths: list[str], output_dir: str = "output") -
             data = json.load(f)
         
         # Group data by folder
-        grouped_data = {}
+        grouped_data = defaultdict(list)
+        # Keys in one directory share their third component once the path has four or more,
+        # so only the first key per directory needs a full Path parse
+        folder_by_dir = {}
         for file_path, items in data.items():
-            # Extract folder name from file path
-            path_parts = Path(file_path).parts
-            if len(path_parts) >= 3:  # Ensure we have enough path components
+            directory = file_path.rpartition('/')[0]
+            folder_name = folder_by_dir.get(directory)
+            if folder_name is None:
+                # Extract folder name from file path
+                path_parts = Path(file_path).parts
+                if len(path_parts) < 3:  # Ensure we have enough path components
+                    continue
                 folder_name = path_parts[2]  # Get the third component
-                if folder_name not in grouped_data:
-                    grouped_data[folder_name] = []
-                grouped_data[folder_name].extend(items)
+                if len(path_parts) >= 4:
+                    folder_by_dir[directory] = folder_name
+            grouped_data[folder_name].extend(items)
+        
+        # Release the parsed mapping and its path keys; the grouped lists hold the items
+        del data
         
         # Write grouped data to separate JSON files
         for folder_name, items in grouped_data.items():
@@ -1,9 +1,11 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from collections import defaultdict
 import io
+import re
+from utils.csv_io import read_csv_fast, to_csv_bytes
 
 st.set_page_config(
     page_title="Shopify Product Analyzer",
@@ -11,94 +13,153 @@ st.set_page_config(
     layout="wide"
 )
 
-def load_and_process_data(file):
-    """Load and process the Shopify CSV data."""
-    df = pd.read_csv(file)
+# Columns used by the analysis below; the rest of the export is never parsed
+NEEDED_COLS = [
+    'Handle', 'Title', 'Variant Price', 'Image Position', 'Image Src', 'Variant Image', 'Tags',
+    'Brand (product.metafields.custom.brand)',
+    'Option1 Name', 'Option1 Value', 'Option2 Name', 'Option2 Value', 'Option3 Name', 'Option3 Value'
+]
+
+@st.cache_data(show_spinner=False)
+def load_and_process_data(file_bytes):
+    """Load and process the Shopify CSV data once per distinct file content."""
+    header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+    usecols = [col for col in NEEDED_COLS if col in header]
+    df = read_csv_fast(file_bytes, usecols=usecols)
     
-    # Group by Handle to get product-level statistics
-    product_stats = []
-    for handle in df['Handle'].unique():
-        product_data = df[df['Handle'] == handle]
-        
-        stats = {
-            'Handle': handle,
-            'Title': product_data['Title'].iloc[0],
-            'Variants': len(product_data[product_data['Variant Price'].notna()]),
-            'Images': len(product_data[product_data['Image Position'].notna()]),
-            'Min Price': product_data['Variant Price'].min(),
-            'Max Price': product_data['Variant Price'].max(),
-            'Tags': product_data['Tags'].iloc[0],
-            'Brand': product_data['Brand (product.metafields.custom.brand)'].iloc[0] if not pd.isna(product_data['Brand (product.metafields.custom.brand)'].iloc[0]) else 'No Brand'
-        }
-        product_stats.append(stats)
+    # Product-level statistics in one grouped pass per column instead of
+    # filtering the frame for every handle
+    handles = df['Handle']
+    first_rows = df.groupby('Handle', sort=False).head(1).set_index('Handle')
+    prices = df['Variant Price'].groupby(handles, sort=False)
+    brands = first_rows['Brand (product.metafields.custom.brand)']
+    product_stats = pd.DataFrame({
+        'Title': first_rows['Title'],
+        'Variants': prices.count(),
+        'Images': df['Image Position'].notna().groupby(handles, sort=False).sum(),
+        'Min Price': prices.min(),
+        'Max Price': prices.max(),
+        'Tags': first_rows['Tags'],
+        'Brand': brands.where(brands.notna(), 'No Brand').infer_objects()
+    }).rename_axis('Handle').reset_index()
     
-    return df, pd.DataFrame(product_stats)
+    return df, product_stats
 
+@st.cache_data(show_spinner=False)
 def get_unique_tags(tags_series):
     """Extract unique tags from the Tags column."""
-    all_tags = []
-    for tags in tags_series.dropna():
-        if isinstance(tags, str):
-            all_tags.extend([tag.strip() for tag in tags.split(',')])
-    return sorted(set(all_tags))
+    # Only text tags are split; an all-empty or numeric column has none
+    if not pd.api.types.is_string_dtype(tags_series):
+        return []
+    return sorted(tags_series.dropna().str.split(',').explode().str.strip().unique())
 
+@st.cache_data(show_spinner=False)
 def analyze_tags(product_stats):
     """Analyze tags and create tag statistics."""
-    tag_stats = defaultdict(lambda: {
-        'product_count': 0,
-        'total_variants': 0,
-        'avg_price': 0.0,
-        'products': []
-    })
+    tagged = product_stats[product_stats['Tags'].notna()]
     
-    for _, row in product_stats.iterrows():
-        if pd.isna(row['Tags']):
-            continue
-            
-        tags = [tag.strip() for tag in str(row['Tags']).split(',')]
-        for tag in tags:
-            tag_stats[tag]['product_count'] += 1
-            tag_stats[tag]['total_variants'] += row['Variants']
-            tag_stats[tag]['avg_price'] += row['Min Price']
-            tag_stats[tag]['products'].append(row['Handle'])
+    # One row per (product, tag); empty and repeated tags count like any other
+    tags = tagged['Tags'].astype(str).str.split(',').explode().str.strip()
+    tag_rows = tagged.loc[tags.index]
     
-    # Calculate averages
-    for tag in tag_stats:
-        tag_stats[tag]['avg_price'] /= tag_stats[tag]['product_count']
+    # Codes follow first appearance, so tags keep the order they are first seen in
+    codes, unique_tags = pd.factorize(tags)
+    product_count = np.bincount(codes, minlength=len(unique_tags))
+    # bincount adds weights in row order, matching a running per-tag total
+    total_variants = np.bincount(codes, weights=tag_rows['Variants'].to_numpy(dtype=float), minlength=len(unique_tags))
+    price_totals = np.bincount(codes, weights=tag_rows['Min Price'].to_numpy(dtype=float), minlength=len(unique_tags))
+    products = tag_rows['Handle'].groupby(codes, sort=False).agg(', '.join)
     
-    return pd.DataFrame([
-        {
-            'Tag': tag,
-            'Product Count': stats['product_count'],
-            'Total Variants': stats['total_variants'],
-            'Average Price': stats['avg_price'],
-            'Products': ', '.join(stats['products'])
-        }
-        for tag, stats in tag_stats.items()
-    ])
+    return pd.DataFrame({
+        'Tag': unique_tags,
+        'Product Count': product_count,
+        'Total Variants': total_variants.astype(np.int64),
+        'Average Price': price_totals / product_count,
+        'Products': products.to_numpy()
+    })
 
+@st.cache_data(show_spinner=False)
 def find_blank_images(df, blank_url="https://kalash.gallery/wp-content/uploads/2023/03/blank.png"):
     """Find products and variants with blank images."""
-    blank_images = []
+    # Check Image Src and Variant Image columns once for the whole frame
+    blank_in_main = df['Image Src'] == blank_url
+    blank_in_variant = df['Variant Image'] == blank_url
     
-    for handle in df['Handle'].unique():
-        product_data = df[df['Handle'] == handle]
-        
-        # Check Image Src and Variant Image columns
-        blank_in_main = product_data['Image Src'] == blank_url
-        blank_in_variant = product_data['Variant Image'] == blank_url
-        
-        if blank_in_main.any() or blank_in_variant.any():
-            blank_images.append({
-                'Handle': handle,
-                'Title': product_data['Title'].iloc[0],
-                'Blank Main Images': blank_in_main.sum(),
-                'Blank Variant Images': blank_in_variant.sum(),
-                'Total Variants': len(product_data[product_data['Variant Price'].notna()]),
-                'Affected Rows': len(product_data[blank_in_main | blank_in_variant])
-            })
+    handles = df['Handle']
+    first_rows = df.groupby('Handle', sort=False).head(1).set_index('Handle')
+    blank_images = pd.DataFrame({
+        'Title': first_rows['Title'],
+        'Blank Main Images': blank_in_main.groupby(handles, sort=False).sum(),
+        'Blank Variant Images': blank_in_variant.groupby(handles, sort=False).sum(),
+        'Total Variants': df['Variant Price'].notna().groupby(handles, sort=False).sum(),
+        'Affected Rows': (blank_in_main | blank_in_variant).groupby(handles, sort=False).sum()
+    }).rename_axis('Handle').reset_index()
+    
+    # Keep only products with at least one blank image
+    has_blank = (blank_images['Blank Main Images'] > 0) | (blank_images['Blank Variant Images'] > 0)
+    return blank_images[has_blank].reset_index(drop=True)
+
+def build_overview_charts(filtered_stats):
+    """Build the price and variant count charts for the filtered products."""
+    fig_price = px.histogram(
+        filtered_stats,
+        x='Min Price',
+        nbins=20,
+        title='Price Distribution'
+    )
+    
+    variant_counts = filtered_stats['Variants'].value_counts().reset_index()
+    variant_counts.columns = ['Variant Count', 'Number of Products']
+    fig_variants = px.bar(
+        variant_counts,
+        x='Variant Count',
+        y='Number of Products',
+        title='Number of Products by Variant Count'
+    )
+    return fig_price, fig_variants
+
+def build_tag_charts(tag_stats):
+    """Build the top-10 tag charts by product count and by total variants."""
+    fig_tag_products = px.bar(
+        tag_stats.sort_values('Product Count', ascending=True).tail(10),
+        x='Product Count',
+        y='Tag',
+        title='Top 10 Tags by Product Count',
+        orientation='h'
+    )
+    fig_tag_variants = px.bar(
+        tag_stats.sort_values('Total Variants', ascending=True).tail(10),
+        x='Total Variants',
+        y='Tag',
+        title='Top 10 Tags by Total Variants',
+        orientation='h'
+    )
+    return fig_tag_products, fig_tag_variants
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def build_option_charts(df):
+    """Build a value distribution pie chart per product option, or None if there are no options."""
+    # Stack the three (name, value) column pairs into one long frame so
+    # every option's values come out of a single grouped pass
+    option_pairs = [
+        df[[f'Option{i} Name', f'Option{i} Value']].set_axis(['Name', 'Value'], axis=1)
+        for i in range(1, 4) if f'Option{i} Name' in df.columns
+    ]
+    options = pd.concat(option_pairs, ignore_index=True) if option_pairs else pd.DataFrame(columns=['Name', 'Value'])
+    
+    if not options['Name'].notna().any():
+        return None
     
-    return pd.DataFrame(blank_images)
+    option_charts = []
+    for option_name, option_values in options.dropna().groupby('Name', sort=False)['Value']:
+        value_counts = option_values.value_counts()
+        fig = px.pie(
+            names=value_counts.index,
+            values=value_counts.values,
+            title=f"Distribution of {option_name}"
+        )
+        option_charts.append((option_name, fig))
+    return option_charts
 
 def main():
     st.title("Shopify Product Data Analyzer")
@@ -106,7 +167,7 @@ def main():
     uploaded_file = st.file_uploader("Upload Shopify Products CSV", type=['csv'])
     
     if uploaded_file:
-        df, product_stats = load_and_process_data(uploaded_file)
+        df, product_stats = load_and_process_data(uploaded_file.getvalue())
         
         # Create tabs
         tab1, tab2, tab3, tab4 = st.tabs([
@@ -146,17 +207,16 @@ def main():
                 all_tags = get_unique_tags(product_stats['Tags'])
                 selected_tags = st.multiselect("Filter by Tags", all_tags)
             
-            # Apply filters
-            filtered_stats = product_stats.copy()
-            filtered_stats = filtered_stats[
-                (filtered_stats['Min Price'] >= price_range[0]) &
-                (filtered_stats['Max Price'] <= price_range[1])
-            ]
+            # Apply filters as one combined mask and a single selection
+            mask = (product_stats['Min Price'] >= price_range[0]) & (product_stats['Max Price'] <= price_range[1])
             
             if selected_tags:
-                filtered_stats = filtered_stats[
-                    filtered_stats['Tags'].apply(lambda x: any(tag in str(x) for tag in selected_tags))
-                ]
+                # One regex scan for any selected tag as a substring; products
+                # without tags match no tag
+                pattern = '|'.join(map(re.escape, selected_tags))
+                mask &= product_stats['Tags'].fillna('').astype(str).str.contains(pattern)
+            
+            filtered_stats = product_stats[mask]
             
             st.dataframe(filtered_stats, hide_index=True)
             
@@ -164,24 +224,12 @@ def main():
             st.header("Visualizations")
             col1, col2 = st.columns(2)
             
+            fig_price, fig_variants = build_overview_charts(filtered_stats)
+            
             with col1:
-                fig_price = px.histogram(
-                    filtered_stats,
-                    x='Min Price',
-                    nbins=20,
-                    title='Price Distribution'
-                )
                 st.plotly_chart(fig_price, use_container_width=True)
             
             with col2:
-                variant_counts = filtered_stats['Variants'].value_counts().reset_index()
-                variant_counts.columns = ['Variant Count', 'Number of Products']
-                fig_variants = px.bar(
-                    variant_counts,
-                    x='Variant Count',
-                    y='Number of Products',
-                    title='Number of Products by Variant Count'
-                )
                 st.plotly_chart(fig_variants, use_container_width=True)
         
         with tab2:
@@ -206,28 +254,16 @@ def main():
             # Tag Visualizations
             col1, col2 = st.columns(2)
             
+            fig_tag_products, fig_tag_variants = build_tag_charts(tag_stats)
+            
             with col1:
-                fig_tag_products = px.bar(
-                    tag_stats.sort_values('Product Count', ascending=True).tail(10),
-                    x='Product Count',
-                    y='Tag',
-                    title='Top 10 Tags by Product Count',
-                    orientation='h'
-                )
                 st.plotly_chart(fig_tag_products, use_container_width=True)
             
             with col2:
-                fig_tag_variants = px.bar(
-                    tag_stats.sort_values('Total Variants', ascending=True).tail(10),
-                    x='Total Variants',
-                    y='Tag',
-                    title='Top 10 Tags by Total Variants',
-                    orientation='h'
-                )
                 st.plotly_chart(fig_tag_variants, use_container_width=True)
             
             # Export Tag Statistics
-            tag_stats_csv = tag_stats.to_csv(index=False)
+            tag_stats_csv = to_csv_bytes(tag_stats)
             st.download_button(
                 label="Download Tag Statistics CSV",
                 data=tag_stats_csv,
@@ -265,7 +301,7 @@ def main():
                     st.metric("Total Blank Variant Images", blank_images_df['Blank Variant Images'].sum())
                 
                 # Export Blank Images Data
-                blank_images_csv = blank_images_df.to_csv(index=False)
+                blank_images_csv = to_csv_bytes(blank_images_df)
                 st.download_button(
                     label="Download Blank Images Report",
                     data=blank_images_csv,
@@ -278,33 +314,12 @@ def main():
         with tab4:
             st.header("Product Options Analysis")
             
-            # Get unique option names
-            option_names = []
-            for i in range(1, 4):
-                option_col = f'Option{i} Name'
-                if option_col in df.columns:
-                    unique_options = df[option_col].dropna().unique()
-                    option_names.extend(unique_options)
-            option_names = list(set(option_names))
+            option_charts = build_option_charts(df)
             
-            if option_names:
-                for option_name in option_names:
-                    option_values = []
-                    for i in range(1, 4):
-                        mask = df[f'Option{i} Name'] == option_name
-                        values = df[mask][f'Option{i} Value'].dropna()
-                        option_values.extend(values)
-                    
-                    if option_values:
-                        value_counts = pd.Series(option_values).value_counts()
-                        
-                        st.subheader(f"{option_name} Distribution")
-                        fig = px.pie(
-                            names=value_counts.index,
-                            values=value_counts.values,
-                            title=f"Distribution of {option_name}"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+            if option_charts is not None:
+                for option_name, fig in option_charts:
+                    st.subheader(f"{option_name} Distribution")
+                    st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No product options found in the data.")
 
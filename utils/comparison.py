@@ -2,8 +2,13 @@ import pandas as pd
 import numpy as np
 from typing import Tuple, Dict, List
 import logging
+from itertools import zip_longest
 
-def compare_csv_files(file1_path: str, file2_path: str, tolerance: float = 0.01) -> Tuple[bool, Dict]:
+# Rows read from each file at a time, so peak memory stays bounded for large exports
+CHUNK_SIZE = 100_000
+
+def compare_csv_files(file1_path: str, file2_path: str, tolerance: float = 0.01,
+                      chunksize: int = CHUNK_SIZE) -> Tuple[bool, Dict]:
     """
     Compare two CSV files for similarity.
     
@@ -11,6 +16,7 @@ def compare_csv_files(file1_path: str, file2_path: str, tolerance: float = 0.01)
         file1_path: Path to first CSV file
         file2_path: Path to second CSV file
         tolerance: Floating point comparison tolerance (default: 0.01)
+        chunksize: Number of rows compared at a time (default: CHUNK_SIZE)
         
     Returns:
         Tuple containing:
@@ -18,9 +24,10 @@ def compare_csv_files(file1_path: str, file2_path: str, tolerance: float = 0.01)
         - Dictionary with detailed comparison results
     """
     try:
-        # Read CSV files
-        df1 = pd.read_csv(file1_path)
-        df2 = pd.read_csv(file2_path)
+        # Read only the headers first so the column check needs no data
+        columns1 = list(pd.read_csv(file1_path, nrows=0).columns)
+        columns2 = list(pd.read_csv(file2_path, nrows=0).columns)
+        columns_match = columns1 == columns2
         
         results = {
             "are_similar": False,
@@ -30,52 +37,79 @@ def compare_csv_files(file1_path: str, file2_path: str, tolerance: float = 0.01)
             "data_match": False
         }
         
+        # Walk both files in paired chunks; once the row counts or columns
+        # are known to differ, the remaining chunks are only counted
+        rows1 = rows2 = 0
+        numeric_mismatch = set()
+        string_differences = {}
+        
+        with pd.read_csv(file1_path, chunksize=chunksize) as reader1, \
+                pd.read_csv(file2_path, chunksize=chunksize) as reader2:
+            for chunk1, chunk2 in zip_longest(reader1, reader2):
+                rows1 += 0 if chunk1 is None else len(chunk1)
+                rows2 += 0 if chunk2 is None else len(chunk2)
+                if not columns_match or chunk1 is None or chunk2 is None or len(chunk1) != len(chunk2):
+                    continue
+                
+                # Numeric comparison with tolerance, all numeric columns in one pass
+                is_numeric = [
+                    chunk1[column].dtype in [np.float64, np.float32, np.int64, np.int32]
+                    and pd.api.types.is_numeric_dtype(chunk2[column])
+                    for column in columns1
+                ]
+                numeric_cols = chunk1.columns[is_numeric]
+                other_cols = chunk1.columns[[not numeric for numeric in is_numeric]]
+                
+                close = np.isclose(chunk1[numeric_cols].fillna(0).to_numpy(dtype=float),
+                                   chunk2[numeric_cols].fillna(0).to_numpy(dtype=float),
+                                   rtol=tolerance).all(axis=0)
+                numeric_mismatch.update(numeric_cols[~close])
+                
+                # String/categorical comparison; as objects so a text column can
+                # be compared with one a chunk happened to parse as numbers
+                other_mismatch = (chunk1[other_cols].astype(object).fillna("")
+                                  != chunk2[other_cols].astype(object).fillna(""))
+                for column in other_cols[other_mismatch.any().to_numpy()]:
+                    # Find specific differences
+                    mask = other_mismatch[column]
+                    differences = string_differences.setdefault(column, {})
+                    for idx in mask[mask].index[:5 - len(differences)].tolist():  # Show first 5 differences
+                        differences[idx] = {
+                            "file1": str(chunk1.loc[idx, column]),
+                            "file2": str(chunk2.loc[idx, column])
+                        }
+        
         # Compare basic properties
-        if df1.shape != df2.shape:
+        shape1 = (rows1, len(columns1))
+        shape2 = (rows2, len(columns2))
+        if shape1 != shape2:
             results["differences"]["shape"] = {
-                "file1": df1.shape,
-                "file2": df2.shape
+                "file1": shape1,
+                "file2": shape2
             }
             return False, results
         else:
             results["shape_match"] = True
             
         # Compare column names
-        if list(df1.columns) != list(df2.columns):
+        if not columns_match:
             results["differences"]["columns"] = {
-                "file1_columns": list(df1.columns),
-                "file2_columns": list(df2.columns),
-                "missing_in_file1": list(set(df2.columns) - set(df1.columns)),
-                "missing_in_file2": list(set(df1.columns) - set(df2.columns))
+                "file1_columns": columns1,
+                "file2_columns": columns2,
+                "missing_in_file1": list(set(columns2) - set(columns1)),
+                "missing_in_file2": list(set(columns1) - set(columns2))
             }
             return False, results
         else:
             results["columns_match"] = True
-            
-        # Compare data by column
-        data_differences = {}
         
-        for column in df1.columns:
-            if df1[column].dtype in [np.float64, np.float32, np.int64, np.int32]:
-                # Numeric comparison with tolerance
-                if not np.allclose(df1[column].fillna(0), 
-                                 df2[column].fillna(0), 
-                                 rtol=tolerance):
-                    data_differences[column] = "Numeric values differ"
-            else:
-                # String/categorical comparison
-                if not (df1[column].fillna("") == df2[column].fillna("")).all():
-                    # Find specific differences
-                    mask = df1[column].fillna("") != df2[column].fillna("")
-                    diff_indices = mask[mask].index.tolist()
-                    differences = {
-                        idx: {
-                            "file1": str(df1.loc[idx, column]),
-                            "file2": str(df2.loc[idx, column])
-                        }
-                        for idx in diff_indices[:5]  # Show first 5 differences
-                    }
-                    data_differences[column] = differences
+        # Report differences in column order
+        data_differences = {}
+        for column in columns1:
+            if column in string_differences:
+                data_differences[column] = string_differences[column]
+            elif column in numeric_mismatch:
+                data_differences[column] = "Numeric values differ"
         
         if data_differences:
             results["differences"]["data"] = data_differences
@@ -0,0 +1,49 @@
+import io
+from typing import BinaryIO, Union
+
+import pandas as pd
+import streamlit as st
+
+def read_csv_fast(file_or_bytes: Union[bytes, BinaryIO], **kwargs) -> pd.DataFrame:
+    """
+    Read a Shopify export with pyarrow's multi-threaded parser, falling back to pandas' default engine.
+    
+    pyarrow rejects quoted fields that span lines, so WordPress exports with HTML
+    descriptions should be read with read_uploaded_csv instead.
+    
+    Columns come back as regular NumPy-backed dtypes, not dtype_backend='pyarrow':
+    callers rely on NaN for missing values (pd.isna, astype(str), fillna) and on
+    the .str results of object columns.
+    
+    Args:
+        file_or_bytes: Raw CSV bytes, or a seekable file such as a Streamlit upload
+        **kwargs: Extra pd.read_csv arguments, passed to both engines
+        
+    Returns:
+        The parsed DataFrame
+    """
+    if isinstance(file_or_bytes, bytes):
+        def source():
+            return io.BytesIO(file_or_bytes)
+    else:
+        start = file_or_bytes.tell()
+        def source():
+            file_or_bytes.seek(start)
+            return file_or_bytes
+    
+    try:
+        return pd.read_csv(source(), engine='pyarrow', **kwargs)
+    except (ImportError, ValueError):
+        # pandas raises Arrow parse failures as ParserError, a ValueError
+        return pd.read_csv(source(), **kwargs)
+
+@st.cache_data(show_spinner=False)
+def read_uploaded_csv(file_bytes: bytes) -> pd.DataFrame:
+    """Read an uploaded CSV with the C parser, once per distinct file content."""
+    return pd.read_csv(io.BytesIO(file_bytes))
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Encode a frame as CSV bytes for download, a block of rows at a time."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, chunksize=10000)
+    return buffer.getvalue()
@@ -0,0 +1,64 @@
+from itertools import product
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+def is_missing(value) -> bool:
+    """Check a single cell for NaN/None without pd.isna's type dispatch."""
+    # NaN is the only value not equal to itself
+    return value is None or value != value
+
+def index_children_by_attributes(children_df: pd.DataFrame, attr_names: List[str]) -> Dict[Tuple, int]:
+    """
+    Map attribute value tuples to the position of the first child matching them.
+    
+    Args:
+        children_df: A parent's variation rows from a WordPress export
+        attr_names: Attribute names, without the meta:attribute_pa_ prefix
+    
+    Returns:
+        Dictionary from value tuples, in attr_names order, to a row position in children_df.
+        A child with an empty attribute is keyed with None in that slot.
+    """
+    child_lookup = {}
+    child_attr_rows = children_df[
+        [f'meta:attribute_pa_{attr_name}' for attr_name in attr_names]
+    ].to_numpy(dtype=object)
+    for child_pos, child_attrs in enumerate(child_attr_rows):
+        child_options = []
+        for child_attr in child_attrs:
+            if is_missing(child_attr):
+                # An empty attribute matches any value
+                child_options.append([None])
+            else:
+                child_value = str(child_attr)
+                child_options.append([v.strip() for v in child_value.split('|')] if '|' in child_value else [child_value])
+        for key in product(*child_options):
+            child_lookup.setdefault(key, child_pos)
+    return child_lookup
+
+def variant_combinations(attr_values: List[List]) -> List[Tuple]:
+    """All option value combinations except the first, already used by the first row."""
+    # Most products have one or two options, which need no generic machinery
+    if len(attr_values) == 1:
+        return [(value,) for value in attr_values[0][1:]]
+    if len(attr_values) == 2:
+        first_values, second_values = attr_values
+        return [(first, second) for first in first_values for second in second_values][1:]
+    # Materialize the combination grid in one call; values are unique per
+    # attribute, so dropping position 0 skips the already handled first one
+    grids = np.meshgrid(*[np.array(values, dtype=object) for values in attr_values], indexing='ij')
+    return list(zip(*(grid.ravel()[1:] for grid in grids)))
+
+def rows_to_frame(rows: List[Dict]) -> pd.DataFrame:
+    """
+    Build the output frame from per-row dicts, one array per column.
+    
+    Columns follow the order keys first appear in; a row without a key gets NaN there.
+    """
+    columns = dict.fromkeys(key for row in rows for key in row)
+    return pd.DataFrame({
+        column: [row.get(column, np.nan) for row in rows]
+        for column in columns
+    })
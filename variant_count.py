@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from utils.csv_io import read_uploaded_csv, to_csv_bytes
 
 st.set_page_config(
     page_title="Shopify Single Variant Product Analysis",
@@ -20,42 +21,46 @@ def analyze_single_variant_products(df):
     col1, col2, col3 = st.columns(3)
     
     # Get products and their variant counts
-    variant_counts = df[df['Variant Price'].notna()].groupby('Handle').size()
+    priced = df[df['Variant Price'].notna()]
+    variant_counts = priced.groupby('Handle').size()
     single_variant_handles = variant_counts[variant_counts == 1].index
     
     # Get total unique products
     total_products = len(df['Handle'].unique())
     total_single_variant = len(single_variant_handles)
     
-    # Analyze single variant products
-    single_variant_analysis = []
-    
-    for handle in single_variant_handles:
-        product_data = df[df['Handle'] == handle]
-        variant_row = product_data[product_data['Variant Price'].notna()].iloc[0]
-        
-        # Get option information
-        options = {}
-        for i in range(1, 4):  # Shopify supports up to 3 options
-            option_name = f'Option{i} Name'
-            option_value = f'Option{i} Value'
-            if option_name in variant_row and not pd.isna(variant_row[option_name]):
-                options[variant_row[option_name]] = variant_row[option_value]
-        
-        analysis_row = {
-            'Handle': handle,
-            'Title': variant_row['Title'],
-            'Variant Price': variant_row.get('Variant Price', 'N/A'),
-            'Compare Price': variant_row.get('Variant Compare At Price', 'N/A'),
-            'Has Options': len(options) > 0,
-            'Number of Options': len(options),
-            'Option Details': options,
-            'Tags': variant_row.get('Tags', ''),
-            'Brand': variant_row.get('Brand (product.metafields.custom.brand)', ''),
-            'Total Images': len(product_data[product_data['Image Src'].notna()])
-        }
-        
-        single_variant_analysis.append(analysis_row)
+    # Single variant products have exactly one priced row, so take it and
+    # the image counts straight from grouped lookups instead of scanning per handle
+    variant_rows = priced.drop_duplicates('Handle').set_index('Handle').loc[single_variant_handles]
+    image_counts = df['Image Src'].notna().groupby(df['Handle']).sum().loc[single_variant_handles]
+    
+    # Get option information; each product's options stay a dict, so a name
+    # repeated across option slots is counted once
+    option_details = [{} for _ in range(total_single_variant)]
+    for i in range(1, 4):  # Shopify supports up to 3 options
+        option_name = f'Option{i} Name'
+        option_value = f'Option{i} Value'
+        if option_name in variant_rows.columns:
+            names = variant_rows[option_name]
+            has_name = names.notna().tolist()
+            for options, present, name, value in zip(option_details, has_name, names.tolist(), variant_rows[option_value].tolist()):
+                if present:
+                    options[name] = value
+    option_counts = np.array([len(options) for options in option_details], dtype=int)
+    
+    # Analyze single variant products, assembled column by column
+    single_variant_analysis = pd.DataFrame({
+        'Handle': variant_rows.index,
+        'Title': variant_rows['Title'],
+        'Variant Price': variant_rows.get('Variant Price', 'N/A'),
+        'Compare Price': variant_rows.get('Variant Compare At Price', 'N/A'),
+        'Has Options': option_counts > 0,
+        'Number of Options': option_counts,
+        'Option Details': option_details,
+        'Tags': variant_rows.get('Tags', ''),
+        'Brand': variant_rows.get('Brand (product.metafields.custom.brand)', ''),
+        'Total Images': image_counts
+    }, index=variant_rows.index).to_dict('records')
     
     # Display summary statistics
     with col1:
@@ -73,7 +78,7 @@ def analyze_single_variant_products(df):
     
     with col3:
         # Count products with options
-        products_with_options = sum(1 for p in single_variant_analysis if p['Has Options'])
+        products_with_options = int((option_counts > 0).sum())
         st.metric(
             "Single Variants with Options",
             products_with_options,
@@ -165,7 +170,7 @@ def analyze_single_variant_products(df):
         
         export_df = pd.DataFrame(export_rows)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        csv = export_df.to_csv(index=False)
+        csv = to_csv_bytes(export_df)
         st.download_button(
             label="Download Single Variant Analysis CSV",
             data=csv,
@@ -179,7 +184,7 @@ def main():
     if uploaded_file is not None:
         try:
             st.info("Processing file...")
-            df = pd.read_csv(uploaded_file)
+            df = read_uploaded_csv(uploaded_file.getvalue())
             
             with st.expander("View Input Data Preview", expanded=True):
                 st.dataframe(df, height=400)